@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Set
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from llm.prompt import TASK_INSTRUCTIONS, field_descriptions
+
+# The system prompt of each task starts with its instruction, which is enough to tell them apart
+TASK_PREFIXES = {task: TASK_INSTRUCTIONS[task][:40] for task in ("extract_ehr", "extract_ehr_patch", "refactor", "question")}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for the provider models.
+
+    Every extraction call fills the fields the last question asked about
+    (the next field of `record` in field_descriptions order before any
+    question), unless the patient response is one of `filler` (small talk
+    that should not advance the interview). Question calls answer with a
+    canned question and refactor returns `record`.
+    `latency` seconds are slept per call so the time spent "in the LLM" is
+    known exactly and can be subtracted from the turn time.
+    """
+
+    record: Dict[str, Any]
+    filler: Set[str] = set()
+    latency: float = 0.0
+    question: str = "ขอบคุณค่ะ ขอถามต่อนะคะ รบกวนเล่าเพิ่มเติมได้ไหมคะ?"
+
+    calls: List[Dict[str, Any]] = []
+    _filled: List[str] = PrivateAttr(default_factory=list)
+    _asked: List[str] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _task(self, messages):
+        system = messages[0].content
+        for task, prefix in TASK_PREFIXES.items():
+            if system.startswith(prefix):
+                return task
+        return "unknown"
+
+    def _reply(self, messages):
+        task = self._task(messages)
+        with self._lock:
+            if task in ("extract_ehr", "extract_ehr_patch"):
+                patient_response = messages[1].content.removeprefix("response: ")
+                if patient_response not in self.filler:
+                    missing = [field for field in field_descriptions if field not in self._filled]
+                    self._filled += [field for field in missing if field in self._asked] or missing[:1]
+                content = json.dumps({field: self.record.get(field) for field in self._filled}, ensure_ascii=False)
+            elif task == "refactor":
+                content = json.dumps(self.record, ensure_ascii=False)
+            else:
+                # The fields being asked about are quoted as "field":"description" after this heading
+                asked = messages[0].content.split("ข้อมูลที่ต้องการถามปัจจุบัน", 1)[-1]
+                self._asked = [field for field in field_descriptions if f'"{field}":' in asked]
+                content = self.question
+            self.calls.append({
+                "task": task,
+                "prompt_chars": sum(len(message.content) for message in messages),
+                "latency": self.latency,
+            })
+        return content
+
+    def reset(self):
+        with self._lock:
+            self._filled = []
+            self._asked = []
+            self.calls = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for token in content.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
@@ -0,0 +1,58 @@
+# Import-time budget check for the app modules.
+#
+#   python -m benchmarks.import_time [--module main] [--budget-ms 1500] [--runs 3] [--top 15]
+#
+# Imports the module in a fresh interpreter with `python -X importtime`,
+# reports the best cumulative time of --runs and the slowest imports, and
+# exits non-zero when it is over --budget-ms so startup regressions (a
+# provider SDK or pythainlp imported at module level again) fail CI.
+import argparse
+import os
+import subprocess
+import sys
+
+
+def import_times(module):
+    env = dict(os.environ)
+    # main.py needs a key to exist, no request is ever made
+    env.setdefault("TYPHOON_CHAT_KEY", "import-time")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when importing the app gets slower than the budget")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # The first run also pays for cold .pyc compilation and disk cache, keep the fastest
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda times: times[args.module])
+    total_ms = best[args.module] / 1000
+
+    print(f"slowest imports of {args.module}:")
+    for name, cumulative in sorted(best.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]:
+        print(f"  {cumulative / 1000:9.1f} ms  {name}")
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import re
+from llm.prompt import TASK_INSTRUCTIONS
+
+SMALL_TALK = [
+    "พยาบาลชื่ออะไรนะครับ",
+    "วันนี้คนเยอะจังเลยนะคะ ต้องรอนานไหมคะ",
+    "ขอโทษครับ เมื่อกี้ถามว่าอะไรนะครับ",
+]
+
+RECORDS = {
+    "sample_1": {
+        "name": {"prefix": "นางสาว", "firstname": "อรุณี", "surname": "สุริยะ"},
+        "age": 35,
+        "gender": "หญิง",
+        "chief_complaint": ["ปวดท้องบ่อย"],
+        "present_illness": ["ปวดแสบท้องน้อย เป็นมาประมาณสองสัปดาห์"],
+        "past_illness": ["แพ้ยาปฏิชีวนะ"],
+        "family_history": [
+            {"relation": "แม่", "condition": "เบาหวาน"},
+            {"relation": "พ่อ", "condition": "ความดันโลหิตสูง"},
+        ],
+        "personal_history": [{"type": "การนอน", "description": "นอนไม่พอ ทานยานอนหลับบางครั้ง"}],
+    },
+    "sample_2": {
+        "name": {"prefix": "นาย", "firstname": "ธนานนท์", "surname": "ศักดิ์เกียรติกุล"},
+        "age": 50,
+        "gender": "ชาย",
+        "chief_complaint": ["ไอแห้ง", "ปวดศีรษะ"],
+        "present_illness": ["ไอแห้งและปวดศีรษะ เป็นมาสองถึงสามวัน ไม่รุนแรง"],
+        "past_illness": [],
+        "family_history": [
+            {"relation": "พ่อ", "condition": "โรคหัวใจ"},
+            {"relation": "แม่", "condition": "เสียชีวิตด้วยมะเร็ง"},
+        ],
+        "personal_history": [{"type": "การนอน", "description": "นอนไม่ค่อยหลับ"}],
+    },
+}
+
+
+def sample_dialogues():
+    """Patient lines of the example conversations in TASK_INSTRUCTIONS["question"]."""
+    sections = re.split(r"#### ตัวอย่าง \d+\n", TASK_INSTRUCTIONS["question"])[1:]
+    dialogues = {}
+    for i, section in enumerate(sections, start=1):
+        # Some lines are not newline terminated, so split on the speaker tag rather than per line
+        dialogues[f"sample_{i}"] = [part.split("\n")[0].strip() for part in section.split("คนไข้:")[1:]]
+    return dialogues
+
+
+def interviews():
+    """Scripted interviews as {name: (patient_turns, record, filler)}.
+
+    The sample dialogues are used as-is, plus two synthetic variants of
+    each: one with small talk between answers, which does not fill any
+    field, and one where every answer is repeated to triple its length.
+    """
+    scripts = {}
+    for name, turns in sample_dialogues().items():
+        record = RECORDS[name]
+        scripts[name] = (turns, record, set())
+        chatty = []
+        for i, turn in enumerate(turns):
+            chatty.extend([turn, SMALL_TALK[i % len(SMALL_TALK)]])
+        scripts[f"{name}_small_talk"] = (chatty, record, set(SMALL_TALK))
+        scripts[f"{name}_verbose"] = ([" ".join([turn] * 3) for turn in turns], record, set())
+    return scripts
@@ -0,0 +1,109 @@
+# Concurrent load test of a running main:app.
+#
+#   python -m benchmarks.stub_server --latency 0.5 &
+#   TYPHOON_BASE_URL=http://127.0.0.1:9000/v1 TYPHOON_CHAT_KEY=stub python main.py &
+#   python -m benchmarks.loadtest --patients 50 [--url http://127.0.0.1:8000] [--think 2 5]
+#
+# Each simulated patient gets its own session and plays one of the scripted
+# interviews: after every answer it waits a random think time, posts to
+# /nurse_response and now and then checks /history and /details, the way
+# the web UI does. Throughput, latency percentiles and error rates are
+# reported per endpoint.
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+import httpx
+from benchmarks.interviews import interviews
+from llm.router import percentile
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+
+    def record(self, endpoint, latency, error=None):
+        self.latencies[endpoint].append(latency)
+        if error is not None:
+            self.errors[endpoint] += 1
+            self.error_samples.setdefault(endpoint, error)
+
+    def report(self, elapsed):
+        print(f"{'endpoint':<18}{'requests':>9}{'req/s':>8}{'errors':>8}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}")
+        for endpoint, latencies in sorted(self.latencies.items()):
+            print(f"{endpoint:<18}{len(latencies):>9}{len(latencies) / elapsed:>8.2f}"
+                  f"{self.errors[endpoint] / len(latencies):>8.1%}{percentile(latencies, 0.5):>8.2f}"
+                  f"{percentile(latencies, 0.95):>8.2f}{percentile(latencies, 0.99):>8.2f}{max(latencies):>8.2f}")
+        for endpoint, error in self.error_samples.items():
+            print(f"first {endpoint} error: {error}")
+
+
+async def call(client, recorder, endpoint, method, path, **kwargs):
+    start_time = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        error = None
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        elif isinstance(response.json(), dict) and "error" in response.json():
+            error = response.json()["error"]
+    except httpx.HTTPError as e:
+        response, error = None, repr(e)
+    recorder.record(endpoint, time.perf_counter() - start_time, error)
+    return response
+
+
+async def patient(client, recorder, turns, model_name, think, check_rate):
+    session_id = uuid.uuid4().hex
+    for patient_response in turns:
+        await asyncio.sleep(random.uniform(*think))
+        response = await call(
+            client, recorder, "/nurse_response", "POST", "/nurse_response",
+            json={"user_input": patient_response, "model_name": model_name, "session_id": session_id},
+        )
+        if random.random() < check_rate:
+            await call(client, recorder, "/history", "GET", "/history", params={"session_id": session_id})
+            await call(client, recorder, "/details", "GET", "/details", params={"session_id": session_id})
+        if response is not None and response.status_code == 200 and "ขอบคุณที่ให้ข้อมูลค่ะ" in response.json().get("nurse_response", ""):
+            break
+    await call(client, recorder, "/reset", "POST", "/reset", params={"session_id": session_id})
+
+
+async def run(args):
+    scripts = [turns for turns, _, _ in interviews().values()]
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.patients, max_keepalive_connections=args.patients)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        start_time = time.perf_counter()
+        tasks = []
+        for i in range(args.patients):
+            tasks.append(asyncio.create_task(
+                patient(client, recorder, scripts[i % len(scripts)], args.model, args.think, args.check_rate)
+            ))
+            # Spread arrivals over the ramp-up instead of starting everyone at once
+            await asyncio.sleep(args.ramp_up / args.patients)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start_time
+    print(f"{args.patients} patients in {elapsed:.1f} seconds")
+    recorder.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent patients against the nurse API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--patients", type=int, default=20, help="concurrent interviews")
+    parser.add_argument("--model", default="typhoon-v1.5x-70b-instruct")
+    parser.add_argument("--think", type=float, nargs=2, default=(2.0, 5.0), metavar=("MIN", "MAX"),
+                        help="seconds a patient takes to answer")
+    parser.add_argument("--check-rate", type=float, default=0.3, help="chance of polling /history and /details after a turn")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which patients arrive")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
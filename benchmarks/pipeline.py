@@ -0,0 +1,106 @@
+# Offline benchmark of a whole interview through VirtualNurseLLM.invoke.
+#
+#   python -m benchmarks.pipeline [--latency 0.0] [--repeat 5] [--max-overhead-ms 20]
+#
+# Every LLM call goes to benchmarks.fake_llm.ScriptedChatModel, so no network
+# or API key is needed. "overhead" is the turn time minus the time spent in
+# the fake model, i.e. the cost of our own code. With --max-overhead-ms or
+# --max-prompt-chars the script exits non-zero when the budget is exceeded,
+# for use as a CI check.
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+import time
+from benchmarks.fake_llm import ScriptedChatModel
+from benchmarks.interviews import interviews
+from llm.history import estimate_tokens
+from llm.llm import VirtualNurseLLM
+from llm.router import percentile
+
+
+def run_interview(turns, record, filler, latency, extraction_mode, question_planning):
+    client = ScriptedChatModel(record=record, filler=filler, latency=latency)
+    nurse_llm = VirtualNurseLLM()
+    nurse_llm.model_name = "scripted"
+    nurse_llm.client = client
+    nurse_llm.extraction_mode = extraction_mode
+    nurse_llm.question_planning = question_planning
+
+    results = []
+    for patient_response in turns:
+        calls_before = len(client.calls)
+        start = time.perf_counter()
+        response = nurse_llm.invoke(patient_response)
+        duration = time.perf_counter() - start
+        calls = client.calls[calls_before:]
+        prompt_chars = sum(call["prompt_chars"] for call in calls)
+        llm_time = sum(call["latency"] for call in calls)
+        results.append({
+            "duration": duration,
+            "overhead": max(0.0, duration - llm_time),
+            "llm_calls": len(calls),
+            "prompt_chars": prompt_chars,
+            "prompt_tokens": estimate_tokens("x" * prompt_chars),
+        })
+        if response == nurse_llm.ending_text:
+            break
+    return results
+
+
+def summarize(results):
+    overheads = [r["overhead"] * 1000 for r in results]
+    total = sum(r["duration"] for r in results)
+    return {
+        "turns": len(results),
+        "turns_per_sec": len(results) / total if total else float("inf"),
+        "overhead_mean_ms": statistics.mean(overheads),
+        "overhead_p95_ms": percentile(overheads, 0.95),
+        "llm_calls_per_turn": statistics.mean(r["llm_calls"] for r in results),
+        "prompt_chars_mean": statistics.mean(r["prompt_chars"] for r in results),
+        "prompt_chars_max": max(r["prompt_chars"] for r in results),
+        "prompt_tokens_mean": statistics.mean(r["prompt_tokens"] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted interviews against a fake LLM")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds slept per fake LLM call")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", choices=["text", "patch"], default="text", help="extraction mode")
+    parser.add_argument("--planning", choices=["single", "grouped"], default="single", help="question planning")
+    parser.add_argument("--max-overhead-ms", type=float, help="fail if the mean per-turn overhead is higher")
+    parser.add_argument("--max-prompt-chars", type=int, help="fail if any turn sends more prompt characters")
+    args = parser.parse_args()
+
+    all_results = []
+    print(f"{'interview':<22}{'turns':>6}{'turns/s':>10}{'overhead ms':>13}{'p95 ms':>9}{'calls':>7}{'prompt chars':>14}{'max':>8}")
+    for name, (turns, record, filler) in interviews().items():
+        results = []
+        # VirtualNurseLLM prints every step, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_interview(turns, record, filler, args.latency, args.mode, args.planning)  # warm up
+            for _ in range(args.repeat):
+                results += run_interview(turns, record, filler, args.latency, args.mode, args.planning)
+        all_results += results
+        s = summarize(results)
+        print(f"{name:<22}{s['turns'] // args.repeat:>6}{s['turns_per_sec']:>10.1f}{s['overhead_mean_ms']:>13.2f}"
+              f"{s['overhead_p95_ms']:>9.2f}{s['llm_calls_per_turn']:>7.1f}{s['prompt_chars_mean']:>14.0f}{s['prompt_chars_max']:>8}")
+
+    s = summarize(all_results)
+    print(f"{'all':<22}{s['turns'] // args.repeat:>6}{s['turns_per_sec']:>10.1f}{s['overhead_mean_ms']:>13.2f}"
+          f"{s['overhead_p95_ms']:>9.2f}{s['llm_calls_per_turn']:>7.1f}{s['prompt_chars_mean']:>14.0f}{s['prompt_chars_max']:>8}")
+
+    failed = False
+    if args.max_overhead_ms is not None and s["overhead_mean_ms"] > args.max_overhead_ms:
+        print(f"FAIL: mean overhead {s['overhead_mean_ms']:.2f} ms > {args.max_overhead_ms} ms")
+        failed = True
+    if args.max_prompt_chars is not None and s["prompt_chars_max"] > args.max_prompt_chars:
+        print(f"FAIL: largest turn prompt {s['prompt_chars_max']} chars > {args.max_prompt_chars}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Micro-benchmark of the prompt building done on every patient turn.
+#
+#   python -m benchmarks.prompt_build [--turns 2000]
+#
+# "legacy" rebuilds the LangChain templates per turn the way VirtualNurseLLM
+# did before the prompt registry, "registry" uses the precompiled prompts.
+import argparse
+import contextlib
+import io
+import time
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+from llm.prompt import TASK_INSTRUCTIONS, JSON_EXAMPLE, field_descriptions
+from llm.llm import VirtualNurseLLM
+
+EHR_DATA = {
+    "name": {"prefix": "นาย", "firstname": "ธนานนท์", "surname": "ศักดิ์เกียรติกุล"},
+    "age": 50,
+    "gender": "ชาย",
+    "chief_complaint": ["ไอแห้ง", "ปวดศีรษะ"],
+}
+PATIENT_RESPONSE = "ก็ประมาณสองสามวันมานี้ครับ แต่ไม่ได้รุนแรงมาก"
+CHAT_HISTORY = [
+    {"role": "assistant", "content": "สวัสดีค่ะ ดิฉัน มะลิ ค่ะ คุณคนไข้ชื่อว่าอะไรคะ?"},
+    {"role": "user", "content": "ชื่อ ธนานนท์ ศักดิ์เกียรติกุลครับ อายุ 50"},
+    {"role": "assistant", "content": "คุณต้อมมีอาการอะไรบ้างที่รู้สึกไม่สบายใจตอนนี้คะ?"},
+    {"role": "user", "content": PATIENT_RESPONSE},
+]
+
+
+def legacy_prompt(task_type):
+    system_template = SystemMessagePromptTemplate.from_template(TASK_INSTRUCTIONS[task_type])
+    user_template = HumanMessagePromptTemplate.from_template("response: {patient_response}")
+    return ChatPromptTemplate.from_messages([system_template, user_template])
+
+
+def legacy_turn():
+    messages = legacy_prompt("extract_ehr").format_messages(
+        ehr_data=EHR_DATA, patient_response=PATIENT_RESPONSE, example=JSON_EXAMPLE
+    )
+    question_prompt = legacy_prompt("question")
+    history_context = "\n".join(f"{entry['role']}: {entry['content']}" for entry in CHAT_HISTORY)
+    context = ", ".join(f"{key}: {value}" for key, value in EHR_DATA.items() if value)
+    messages += ChatPromptTemplate.from_messages([question_prompt, history_context]).format_messages(
+        description=f'"present_illness":"{field_descriptions["present_illness"]}"',
+        context=context,
+        patient_response=PATIENT_RESPONSE,
+        field_descriptions=field_descriptions,
+        time_now=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return messages
+
+
+def registry_turn(nurse_llm):
+    messages = nurse_llm._ehr_messages(PATIENT_RESPONSE)
+    messages += nurse_llm._question_messages(PATIENT_RESPONSE, nurse_llm.create_prompt("question"))
+    return messages
+
+
+def measure(fn, turns):
+    # fetching_chat prints the field it asks about, keep the output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm up
+        start = time.perf_counter()
+        for _ in range(turns):
+            fn()
+    return (time.perf_counter() - start) / turns * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn prompt building cost, legacy vs registry")
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    nurse_llm = VirtualNurseLLM()
+    nurse_llm.reset()
+    nurse_llm.ehr_data = dict(EHR_DATA)
+    for entry in CHAT_HISTORY:
+        nurse_llm.add_message(entry["role"], entry["content"])
+
+    legacy = measure(legacy_turn, args.turns)
+    registry = measure(lambda: registry_turn(nurse_llm), args.turns)
+    print(f"legacy   : {legacy:9.1f} us/turn")
+    print(f"registry : {registry:9.1f} us/turn")
+    print(f"speedup  : {legacy / registry:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
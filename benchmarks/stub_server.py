@@ -0,0 +1,132 @@
+# OpenAI-compatible stand-in for the typhoon/openthaigpt/groq endpoints.
+#
+#   python -m benchmarks.stub_server [--port 9000] [--latency 0.5] [--jitter 0.2] [--error-rate 0]
+#
+# Point the app at it with
+#   TYPHOON_BASE_URL=http://127.0.0.1:9000/v1 OPENTHAIGPT_BASE_URL=http://127.0.0.1:9000/v1
+#   GROQ_BASE_URL=http://127.0.0.1:9000 TYPHOON_CHAT_KEY=stub GROQ_CHAT_KEY=stub
+#
+# It is stateless: each extraction call fills the first field that is not in
+# the EHR embedded in its prompt, so concurrent interviews still progress
+# and end like real ones.
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from benchmarks.fake_llm import TASK_PREFIXES
+from benchmarks.interviews import RECORDS
+from llm.prompt import field_descriptions
+
+RECORD = RECORDS["sample_1"]
+QUESTION = "ขอบคุณค่ะ ขอถามต่อนะคะ รบกวนเล่าเพิ่มเติมได้ไหมคะ?"
+
+app = FastAPI()
+app.state.latency = 0.5
+app.state.jitter = 0.2
+app.state.error_rate = 0.0
+app.state.requests = 0
+app.state.disconnected = 0
+
+
+def reply(messages):
+    system = messages[0]["content"] if messages else ""
+    task = next((task for task, prefix in TASK_PREFIXES.items() if system.startswith(prefix)), "question")
+    if task in ("extract_ehr", "extract_ehr_patch"):
+        # The current EHR is rendered as a Python dict, the JSON example uses double quotes
+        known = [field for field in field_descriptions if f"'{field}'" in system]
+        missing = [field for field in field_descriptions if field not in known]
+        fields = known + missing[:1]
+        return json.dumps({field: RECORD[field] for field in fields}, ensure_ascii=False)
+    if task == "refactor":
+        return json.dumps(RECORD, ensure_ascii=False)
+    return QUESTION
+
+
+def completion(model, content):
+    prompt_tokens = 1000
+    completion_tokens = len(content) // 3 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def stream_chunks(model, content):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    for token in content.split(" "):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def wait(request, seconds):
+    # Stop early when the client hangs up, e.g. the router cancelling a losing hedge
+    deadline = time.monotonic() + seconds
+    while (remaining := deadline - time.monotonic()) > 0:
+        if await request.is_disconnected():
+            app.state.disconnected += 1
+            return False
+        await asyncio.sleep(min(remaining, 0.05))
+    return True
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    if not await wait(request, max(0.0, random.gauss(app.state.latency, app.state.jitter))):
+        return JSONResponse({"error": {"message": "client disconnected"}}, status_code=499)
+    if random.random() < app.state.error_rate:
+        return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+    content = reply(body.get("messages", []))
+    model = body.get("model", "stub")
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(model, content), media_type="text/event-stream")
+    return completion(model, content)
+
+
+@app.get("/v1/models")
+@app.get("/openai/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+
+@app.get("/stats")
+def stats():
+    return {"requests": app.state.requests, "disconnected": app.state.disconnected}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
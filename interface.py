@@ -36,6 +36,9 @@ def reset_history():
 def view_chat_history():
     try:    
         response = requests.get(f"{API_BASE_URL}/history")
+        if response.status_code == 404:
+            # No conversation has started yet
+            return "No chat history available."
         response.raise_for_status()
         chat_history = response.json().get("chat_history", [])
         if not chat_history:
@@ -59,6 +62,8 @@ import time
 def view_ehr_details(view):
     try:
         response = requests.get(f"{API_BASE_URL}/details")
+        if response.status_code == 404:
+            return "No EHR details available."
         response.raise_for_status()
         ehr_data = response.json()
         if view == "details":
@@ -93,7 +98,7 @@ def create_gradio_interface():
                     lines=2,
                 )
                 model_name = gr.Radio(
-                    choices=["typhoon-v1.5x-70b-instruct", "openthaigpt", "llama-3.3-70b-versatile"],
+                    choices=["typhoon-v1.5x-70b-instruct", "openthaigpt", "llama-3.3-70b-versatile", "router"],
                     value="typhoon-v1.5x-70b-instruct",
                     label="Model Selection",
             )
@@ -22,4 +22,29 @@ class EHRModel(BaseModel):
     present_illness: List[str] = Field(default_factory=list, description="Details about the current illness (e.g., when it started, nature of symptoms)")
     past_illness: List[str] = Field(default_factory=list, description="Past illnesses, allergies, etc.")
     family_history: List[FamilyHistory] = Field(default_factory=list, description="Health issues in the family")
-    personal_history: List[PersonalHistory] = Field(default_factory=list, description="Personal health history (e.g., sleep patterns, medications taken)")
\ No newline at end of file
+    personal_history: List[PersonalHistory] = Field(default_factory=list, description="Personal health history (e.g., sleep patterns, medications taken)")
+    def apply_patch(self, patch: "EHRModel") -> "EHRModel":
+        """Return a copy with the fields set on `patch` merged in.
+
+        List fields are appended to (items already present are skipped), the
+        name is merged part by part and other scalars are replaced. Fields the
+        patch did not set, or set to null, are left unchanged.
+        """
+        merged = self.model_dump()
+        for field in patch.model_fields_set:
+            value = getattr(patch, field)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                existing = merged[field]
+                for item in value:
+                    item = item.model_dump() if isinstance(item, BaseModel) else item
+                    if item not in existing:
+                        existing.append(item)
+            elif isinstance(value, Name):
+                name = merged[field] or {}
+                name.update({k: v for k, v in value.model_dump().items() if v is not None})
+                merged[field] = name
+            else:
+                merged[field] = value
+        return EHRModel.model_validate(merged)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_response(text):
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def _canonical(value):
+    # EHR data is a plain dict during the interview and an EHRModel after refactor_ehr
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def prompt_version(instruction):
+    return hashlib.sha256(instruction.encode("utf-8")).hexdigest()[:16]
+
+
+class ExtractionCache:
+    """Content-addressed cache of extract_ehr results.
+
+    Keys hash the current EHR, the normalized patient response and the model
+    name. Entries live in an in-memory LRU and, when `path` is given, in a
+    SQLite file that survives restarts. `namespace` should identify the
+    extraction prompt: rows written under another namespace are purged on
+    open, and every entry expires after `ttl` seconds.
+    """
+
+    def __init__(self, namespace, max_entries=1024, ttl=86400, path=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "DELETE FROM extraction_cache WHERE namespace != ? OR stored_at < ?",
+                (namespace, time.time() - ttl),
+            )
+            self._db.commit()
+
+    def make_key(self, ehr_data, patient_response, model_name):
+        payload = json.dumps(
+            {
+                "namespace": self.namespace,
+                "ehr_data": ehr_data,
+                "patient_response": normalize_response(patient_response),
+                "model_name": model_name,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=_canonical,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+                self.expired += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM extraction_cache WHERE key = ? AND namespace = ?",
+                    (key, self.namespace),
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache (key, namespace, value, stored_at) VALUES (?, ?, ?, ?)",
+                    (key, self.namespace, value, now),
+                )
+                self._db.commit()
+
+    def _remember(self, key, stored_at, value):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM extraction_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
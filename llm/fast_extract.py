@@ -0,0 +1,134 @@
+import re
+
+# Longer prefixes first so "นางสาว" is not read as "นาง" + "สาว..."
+PREFIX_GENDER = {
+    "นางสาว": "หญิง",
+    "น.ส.": "หญิง",
+    "เด็กหญิง": "หญิง",
+    "ด.ญ.": "หญิง",
+    "เด็กชาย": "ชาย",
+    "ด.ช.": "ชาย",
+    "นาง": "หญิง",
+    "นาย": "ชาย",
+}
+NAME_PATTERN = re.compile(
+    r"(?:^|\s|ชื่อ)(?P<prefix>" + "|".join(re.escape(p) for p in PREFIX_GENDER) + r")\s*"
+    r"(?P<firstname>[ก-๙]+)\s+(?P<surname>[ก-๙]+)(?=\s|$)"
+)
+PARTICLES = ("ครับผม", "นะครับ", "นะคะ", "ครับ", "ค่ะ", "คะ", "ค่า", "คับ", "จ้า", "จ้ะ")
+GENDER_WORDS = {
+    "ชาย": "ชาย",
+    "ผู้ชาย": "ชาย",
+    "เพศชาย": "ชาย",
+    "หญิง": "หญิง",
+    "ผู้หญิง": "หญิง",
+    "เพศหญิง": "หญิง",
+}
+AGE_UNITS = {"ปี", "ขวบ"}
+FILLER = set(PARTICLES) | AGE_UNITS | {
+    "นะ", "ผม", "กระผม", "ดิฉัน", "ฉัน", "หนู", "ชื่อ", "นามสกุล", "อายุ", "เพศ", "เป็น", "คือ",
+    "ใช่", "ตอนนี้", "แล้ว", ".", ",", "!", "?",
+}
+
+
+def _strip_particles(word):
+    stripped = True
+    while stripped:
+        stripped = False
+        for particle in PARTICLES:
+            if word.endswith(particle) and len(word) > len(particle):
+                word = word[: -len(particle)]
+                stripped = True
+    return word
+
+
+class ThaiFastExtractor:
+    """Rule-based reader for answers that only state name, age or gender.
+
+    `extract` returns the fields it found only when every word of the answer
+    is accounted for, so the LLM extraction can be skipped safely; anything
+    it does not understand returns None and goes to the model as before.
+    A bare number is only read as an age when the nurse asked for the age
+    or the patient said "อายุ", so "2 ปี" answering a duration question is
+    left to the model. Answers that would change a field already in
+    `ehr_data` also go to the model.
+    Without pythainlp installed it disables itself and always returns None.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._pythainlp = None
+        self.attempts = 0
+        self.llm_calls_saved = 0
+        self.fields_filled = {"name": 0, "age": 0, "gender": 0}
+
+    def load(self):
+        """Import pythainlp and build its dictionary, returns whether the fast path is usable.
+
+        Slow the first time, the app calls it at startup off the event loop.
+        """
+        if self._pythainlp is None and self.enabled:
+            try:
+                from pythainlp.tokenize import word_tokenize
+                from pythainlp.util import normalize, thai_digit_to_arabic_digit
+            except ImportError as e:
+                print(f"Fast extraction disabled, pythainlp is not available: {e}")
+                self.enabled = False
+                return False
+            # The first tokenize call builds the word trie
+            word_tokenize("ทดสอบ")
+            self._pythainlp = (word_tokenize, normalize, thai_digit_to_arabic_digit)
+        return self.enabled
+
+    def extract(self, patient_response, expected_field=None, ehr_data=None):
+        if not self.load():
+            return None
+        word_tokenize, normalize, thai_digit_to_arabic_digit = self._pythainlp
+
+        self.attempts += 1
+        text = thai_digit_to_arabic_digit(normalize(patient_response or "")).strip()
+        fields = {}
+
+        match = NAME_PATTERN.search(text)
+        if match:
+            prefix = match.group("prefix")
+            fields["name"] = {
+                "prefix": prefix,
+                "firstname": match.group("firstname"),
+                "surname": _strip_particles(match.group("surname")),
+            }
+            fields["gender"] = PREFIX_GENDER[prefix]
+            text = f"{text[:match.start()]} {text[match.end():]}"
+
+        tokens = word_tokenize(text, keep_whitespace=False)
+        for i, token in enumerate(tokens):
+            if token.isdigit():
+                age = int(token)
+                explicit = i > 0 and tokens[i - 1] == "อายุ"
+                if "age" in fields or not 0 < age < 130 or not (explicit or expected_field == "age"):
+                    return None
+                fields["age"] = age
+            elif token in GENDER_WORDS:
+                if fields.get("gender", GENDER_WORDS[token]) != GENDER_WORDS[token]:
+                    return None
+                fields["gender"] = GENDER_WORDS[token]
+            elif token not in FILLER:
+                return None
+
+        if not fields:
+            return None
+        if ehr_data and any(ehr_data.get(field) and ehr_data[field] != value for field, value in fields.items()):
+            # A correction, or a misread, either way not for the rules to decide
+            return None
+        self.llm_calls_saved += 1
+        for field in fields:
+            self.fields_filled[field] += 1
+        return fields
+
+    def stats(self):
+        return {
+            "available": self.enabled,
+            "attempts": self.attempts,
+            "llm_calls_saved": self.llm_calls_saved,
+            "fields_filled": dict(self.fields_filled),
+        }
@@ -0,0 +1,90 @@
+from collections import deque
+
+
+def estimate_tokens(text):
+    # Thai is written without spaces, so count characters; ~3 per token is close for the models we use
+    return len(text) // 3 + 1
+
+
+def summarize_turn(role, content, max_chars=120):
+    # Questions can be regenerated from the EHR, only what the patient said is worth keeping
+    if role != "user" or not content:
+        return None
+    content = " ".join(content.split())
+    if len(content) > max_chars:
+        content = content[:max_chars] + "..."
+    return f"- ผู้ป่วย: {content}"
+
+
+class _RenderedLines:
+    # Newline-joined lines kept as one string that is appended to and trimmed from the front
+    def __init__(self):
+        self.lines = deque()
+        self.text = ""
+        self.tokens = 0
+
+    def append(self, line, tokens):
+        self.lines.append((line, tokens))
+        self.text = f"{self.text}\n{line}" if self.text else line
+        self.tokens += tokens
+
+    def popleft(self):
+        line, tokens = self.lines.popleft()
+        self.text = self.text[len(line) + 1:]
+        self.tokens -= tokens
+        return line
+
+    def __len__(self):
+        return len(self.lines)
+
+
+class HistoryWindow:
+    """Token-budgeted transcript of the interview for prompt context.
+
+    The most recent messages are kept verbatim within `token_budget`. Older
+    messages are folded into a rolling summary bounded by `summary_budget`,
+    so the rendered history stays roughly the same size however long the
+    interview runs. `summarizer(role, content)` returns the summary line for
+    an evicted message, or None to drop it.
+    """
+
+    summary_header = "# สรุปบทสนทนาก่อนหน้า:"
+
+    def __init__(self, token_budget=1500, summary_budget=300, summarizer=summarize_turn):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer
+        self._recent = _RenderedLines()
+        self._roles = deque()
+        self._summary = _RenderedLines()
+        self.summarized_messages = 0
+
+    def append(self, role, content):
+        line = f"{role}: {content}"
+        self._recent.append(line, estimate_tokens(line))
+        self._roles.append((role, content))
+        # Always keep the latest message even if it alone exceeds the budget
+        while self._recent.tokens > self.token_budget and len(self._recent) > 1:
+            self._recent.popleft()
+            self._fold(*self._roles.popleft())
+
+    def _fold(self, role, content):
+        self.summarized_messages += 1
+        summary_line = self.summarizer(role, content)
+        if not summary_line:
+            return
+        self._summary.append(summary_line, estimate_tokens(summary_line))
+        while self._summary.tokens > self.summary_budget and len(self._summary) > 1:
+            self._summary.popleft()
+
+    def render(self):
+        if not self._summary.text:
+            return self._recent.text
+        return f"{self.summary_header}\n{self._summary.text}\n\n{self._recent.text}"
+
+    @property
+    def tokens(self):
+        return self._recent.tokens + self._summary.tokens
+
+    def __len__(self):
+        return len(self._recent)
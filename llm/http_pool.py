@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+import time
+import httpx
+
+GROQ_BASE_URL = "https://api.groq.com"
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def http2_enabled():
+    if os.getenv("HTTP2", "true").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60)),
+    )
+
+
+def get_http_clients(base_url):
+    """Return the (sync, async) httpx clients shared by every model on `base_url`."""
+    with _lock:
+        if base_url not in _clients:
+            options = {"limits": pool_limits(), "http2": http2_enabled()}
+            _clients[base_url] = (httpx.Client(**options), httpx.AsyncClient(**options))
+        return _clients[base_url]
+
+
+async def warm_up(probes, timeout=5):
+    """Open a pooled connection per base_url by requesting its probe URL."""
+    # Any response, even 401, means the TCP/TLS connection is now open in the pool
+    async def touch(base_url, probe_url):
+        _, client = get_http_clients(base_url)
+        start_time = time.time()
+        try:
+            response = await client.get(probe_url, timeout=timeout)
+            print(f"Warmed up {base_url} ({response.status_code}) in {time.time() - start_time:.2f} seconds")
+        except httpx.HTTPError as e:
+            print(f"Warm-up of {base_url} failed: {e!r}")
+
+    await asyncio.gather(*(touch(base_url, probe_url) for base_url, probe_url in probes.items()))
+
+
+async def aclose_all():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for sync_client, async_client in clients:
+        sync_client.close()
+        await async_client.aclose()
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+
+def ehr_delta(before, after):
+    return {
+        "set": {key: value for key, value in after.items() if before.get(key) != value},
+        "unset": [key for key in before if key not in after],
+    }
+
+
+class TurnJournal:
+    """Append-only per-session journal of interview turns.
+
+    Each turn appends the user input, the nurse's reply and the EHR delta to
+    `<directory>/<key>.journal`, where key is the sha256 of the session id.
+    Every `snapshot_every` turns the full state is written to
+    `<key>.snapshot.json` instead and the journal is truncated, so recovery
+    reads one snapshot plus a short tail.
+
+    Records are only queued on the request path. A background thread writes
+    whatever is queued every `flush_interval` seconds and fsyncs each file
+    once per batch (group commit). Queued records are also kept per session
+    until written, so a restore never waits for the writer. Once
+    `max_queue` records are queued new ones are dropped and counted, and
+    the session's next turn is written as a full snapshot instead so its
+    journal stays consistent.
+    """
+
+    def __init__(self, directory, snapshot_every=20, flush_interval=0.05, fsync=True, max_queue=10000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._seq = {}
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._pending = {}
+        self._resnapshot = set()
+        self._closed = False
+        self.records = 0
+        self.dropped = 0
+        self.batches = 0
+        self.snapshots = 0
+        self.restored = 0
+        self._thread = threading.Thread(target=self._run, name="turn-journal", daemon=True)
+        self._thread.start()
+
+    def _paths(self, session_id):
+        # Session ids come from clients, hash them so every id gets its own safe file name
+        name = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, name)
+        return f"{base}.journal", f"{base}.snapshot.json"
+
+    def _next_seq(self, session_id):
+        self._seq[session_id] = self._seq.get(session_id, 0) + 1
+        return self._seq[session_id]
+
+    def _put(self, session_id, record):
+        if self._closed:
+            return
+        with self._lock:
+            # Discards are never dropped, a stale journal would bring an expired session back
+            if record is not None and self._queue.qsize() >= self.max_queue:
+                self.dropped += 1
+                self._resnapshot.add(session_id)
+                return
+            self._queue.put_nowait((session_id, record))
+            self._pending.setdefault(session_id, []).append(record)
+            if record is None or record["type"] == "snapshot":
+                self._resnapshot.discard(session_id)
+
+    def record_turn(self, session_id, nurse_llm, patient_response, before_ehr):
+        seq = self._next_seq(session_id)
+        if seq % self.snapshot_every == 0 or session_id in self._resnapshot:
+            self._put(session_id, {"seq": seq, "type": "snapshot", "state": nurse_llm.dump_state()})
+            return
+        self._put(session_id, {
+            "seq": seq,
+            "type": "turn",
+            "user": patient_response,
+            "assistant": nurse_llm.current_question,
+            "ehr": ehr_delta(before_ehr, nurse_llm.ehr_snapshot()),
+        })
+
+    def record_ehr(self, session_id, ehr_data):
+        # EHR replaced outside a turn, e.g. by the background refactor job
+        self._put(session_id, {"seq": self._next_seq(session_id), "type": "ehr", "ehr": ehr_data})
+
+    def record_reset(self, session_id, nurse_llm):
+        self._put(session_id, {"seq": self._next_seq(session_id), "type": "snapshot", "state": nurse_llm.dump_state()})
+
+    def discard(self, session_id):
+        self._seq.pop(session_id, None)
+        self._put(session_id, None)
+
+    def sweep(self, max_age):
+        """Delete sessions not written to for `max_age` seconds, e.g. sessions that expired while the app was down.
+
+        A session's journal and snapshot go together, by the newest mtime of
+        the two, so an old snapshot is kept while its journal is still
+        growing. Returns the number of sessions removed.
+        """
+        cutoff = time.time() - max_age
+        sessions = {}
+        removed = 0
+        with self._file_lock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if os.path.isfile(path):
+                    sessions.setdefault(name.split(".", 1)[0], []).append(path)
+            for paths in sessions.values():
+                if max(os.path.getmtime(path) for path in paths) < cutoff:
+                    for path in paths:
+                        os.remove(path)
+                    removed += 1
+        return removed
+
+    def exists(self, session_id):
+        """Whether `session_id` has anything to restore, without reading it."""
+        with self._lock:
+            pending = self._pending.get(session_id)
+            if pending:
+                # Anything queued after a discard starts the session over
+                return pending[-1] is not None
+        return any(os.path.exists(path) for path in self._paths(session_id))
+
+    def load(self, session_id):
+        """Return (snapshot, journal records after it) for `session_id`."""
+        # Waits for at most one file write, never for the queue. A record leaves _pending
+        # only after it is written, so the files plus _pending cover every turn
+        with self._file_lock:
+            with self._lock:
+                pending = list(self._pending.get(session_id, ()))
+            if None in pending:
+                # Discarded since, whatever is on disk is stale
+                snapshot, records = None, []
+                pending = pending[len(pending) - pending[::-1].index(None):]
+            else:
+                snapshot, records = self._read(session_id)
+        for record in pending:
+            last_seq = records[-1]["seq"] if records else snapshot["seq"] if snapshot else 0
+            if record["seq"] <= last_seq:
+                # Already written while the files were read
+                continue
+            if record["type"] == "snapshot":
+                snapshot, records = record, []
+            else:
+                records.append(record)
+        return snapshot, records
+
+    def _read(self, session_id):
+        journal_path, snapshot_path = self._paths(session_id)
+        snapshot = None
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        records = []
+        if os.path.exists(journal_path):
+            valid_bytes = 0
+            with open(journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash, cut it off so new turns are not appended after it
+                        print(f"Truncating torn journal record for session {session_id}")
+                        os.truncate(journal_path, valid_bytes)
+                        break
+                    valid_bytes += len(line)
+                    if snapshot is None or record["seq"] > snapshot["seq"]:
+                        records.append(record)
+        return snapshot, records
+
+    def restore(self, session_id, nurse_llm):
+        """Replay the journal of `session_id` onto a fresh nurse_llm, returns whether anything was found."""
+        snapshot, records = self.load(session_id)
+        if snapshot is None and not records:
+            return False
+        seq = 0
+        if snapshot is not None:
+            nurse_llm.load_state(snapshot["state"])
+            seq = snapshot["seq"]
+        for record in records:
+            if record["type"] == "turn":
+                if record["user"]:
+                    nurse_llm.add_message("user", record["user"])
+                if record["assistant"]:
+                    nurse_llm.add_message("assistant", record["assistant"])
+                nurse_llm.current_patient_response = record["user"]
+                nurse_llm.current_question = record["assistant"]
+                ehr_data = nurse_llm.ehr_snapshot()
+                ehr_data.update(record["ehr"]["set"])
+                for key in record["ehr"]["unset"]:
+                    ehr_data.pop(key, None)
+                nurse_llm.ehr_data = ehr_data
+            elif record["type"] == "ehr":
+                nurse_llm.ehr_data = record["ehr"]
+            seq = record["seq"]
+        self._seq[session_id] = seq
+        self.restored += 1
+        return True
+
+    def _write_snapshot(self, snapshot_path, record):
+        tmp_path = f"{snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+        self.snapshots += 1
+
+    def _write_session(self, session_id, records):
+        journal_path, snapshot_path = self._paths(session_id)
+        lines = []
+        truncate = False
+        for record in records:
+            if record is None:
+                lines, truncate = [], True
+                if os.path.exists(snapshot_path):
+                    os.remove(snapshot_path)
+            elif record["type"] == "snapshot":
+                # Everything journaled so far is folded into the snapshot
+                self._write_snapshot(snapshot_path, record)
+                lines, truncate = [], True
+            else:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if truncate and not lines:
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            return
+        with open(journal_path, "w" if truncate else "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _write(self, batch):
+        by_session = {}
+        for session_id, record in batch:
+            by_session.setdefault(session_id, []).append(record)
+        for session_id, records in by_session.items():
+            # load() reads a session's files under the same lock, so it never sees them half written
+            with self._file_lock:
+                self._write_session(session_id, records)
+        self.records += len(batch)
+        self.batches += 1
+
+    def _run(self):
+        while not (self._closed and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Whatever arrived while the last batch was being written goes out together
+            time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except OSError as e:
+                print(f"Turn journal write failed: {e}")
+                with self._lock:
+                    # Lost records would break the chain of deltas, start these sessions over from a snapshot
+                    self._resnapshot.update(session_id for session_id, _ in batch)
+            with self._lock:
+                for session_id, _ in batch:
+                    pending = self._pending[session_id]
+                    pending.pop(0)
+                    if not pending:
+                        del self._pending[session_id]
+            for _ in batch:
+                self._queue.task_done()
+
+    def close(self, timeout=5):
+        self._closed = True
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "queued": self._queue.qsize(),
+            "records": self.records,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "snapshots": self.snapshots,
+            "restored": self.restored,
+        }
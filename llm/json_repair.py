@@ -0,0 +1,121 @@
+import ast
+import json
+import re
+from typing import get_origin
+from pydantic import ValidationError
+from llm.basemodel import EHRModel
+
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+def _scan(text):
+    # Walk the first JSON object: replace Python literals outside strings and
+    # close any brackets left open by a truncated response
+    out = []
+    stack = []
+    in_string = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == in_string:
+                in_string = None
+            i += 1
+            continue
+        if char in "\"'":
+            in_string = char
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                out.append(char)
+                return "".join(out)
+        else:
+            for literal, replacement in _PY_LITERALS.items():
+                if text.startswith(literal, i) and not text[i + len(literal):i + len(literal) + 1].isalnum():
+                    out.append(replacement)
+                    i += len(literal)
+                    break
+            else:
+                out.append(char)
+                i += 1
+            continue
+        out.append(char)
+        i += 1
+    if in_string:
+        out.append(in_string)
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def repair_json(content):
+    """Best-effort parse of the JSON object in a model response, or None."""
+    if not content:
+        return None
+    text = _FENCE.sub("", content)
+    start = text.find("{")
+    if start == -1:
+        return None
+    text = _TRAILING_COMMA.sub(r"\1", _scan(text[start:]))
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # Single-quoted keys/strings: parse as a Python literal instead
+        try:
+            data = ast.literal_eval(re.sub(r"\b(null|true|false)\b", lambda m: {"null": "None", "true": "True", "false": "False"}[m.group(1)], text))
+        except (ValueError, SyntaxError):
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _coerce_age(value):
+    if isinstance(value, str):
+        match = re.search(r"\d+", value)
+        return int(match.group()) if match else None
+    return value
+
+
+def coerce_ehr(data):
+    """Validate `data` as an EHRModel, dropping only the parts that do not fit."""
+    if not isinstance(data, dict):
+        return None
+    data = dict(data)
+    if "age" in data:
+        data["age"] = _coerce_age(data["age"])
+    try:
+        return EHRModel.model_validate(data)
+    except ValidationError:
+        pass
+
+    fields = {}
+    for name, field in EHRModel.model_fields.items():
+        if name not in data or data[name] is None:
+            continue
+        value = data[name]
+        try:
+            EHRModel.model_validate({name: value})
+            fields[name] = value
+            continue
+        except ValidationError:
+            pass
+        # A scalar field with the wrong type is dropped, only list fields keep their valid items
+        if isinstance(value, list) and get_origin(field.annotation) is list:
+            kept = []
+            for item in value:
+                try:
+                    EHRModel.model_validate({name: [item]})
+                    kept.append(item)
+                except ValidationError:
+                    pass
+            fields[name] = kept
+    return EHRModel.model_validate(fields)
@@ -1,14 +1,23 @@
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from pydantic import ValidationError
-import json
+from langchain_core.messages import HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+import asyncio
 from pprint import pprint
 from llm.basemodel import EHRModel
-from llm.prompt import field_descriptions, TASK_INSTRUCTIONS, JSON_EXAMPLE
-from llm.models import get_model
+from llm.prompt import field_descriptions, field_groups, GROUPED_QUESTION_NOTE, TASK_INSTRUCTIONS, JSON_EXAMPLE, GREETING_TEXT, ENDING_TEXT
+from llm.models import get_model, model_list
+from llm.json_repair import repair_json, coerce_ehr
+from llm.history import HistoryWindow
+from llm.prompt_registry import PROMPTS
+from llm.refactor_job import RefactorJob
+from llm.metrics import STAGE_SECONDS, EXTRACTION_RETRIES, EXTRACTION_CACHE, FAST_EXTRACT, QUESTION_PLAN, QUESTION_PLAN_FIELDS, record_usage
 import time
 
+# Shared by every session for the sync speculative path and background refactor jobs
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ehr-extract")
+
 class VirtualNurseLLM:
-    def __init__(self, base_url=None, model_name=None, api_key=None, model_type=None):
+    def __init__(self, base_url=None, model_name=None, api_key=None, model_type=None, history_token_budget=1500, history_summary_budget=300):
         self.client = None
         if model_name:
             self.client = get_model(model_name=model_name)
@@ -17,165 +26,553 @@ class VirtualNurseLLM:
         self.field_descriptions = field_descriptions
         self.JSON_EXAMPLE = JSON_EXAMPLE
         self.ehr_data = {}
+        self.history_token_budget = history_token_budget
+        self.history_summary_budget = history_summary_budget
         self.chat_history = []
-        self.chat_history.append({"role": "assistant", "content": "สวัสดีค่ะ ดิฉัน มะลิ เป็นพยาบาลเสมือนที่จะมาดูแลการซักประวัตินะคะ"})
+        # Bounded transcript used in prompts, chat_history keeps the full record
+        self.history = HistoryWindow(history_token_budget, history_summary_budget)
+        self.add_message("assistant", GREETING_TEXT)
         self.current_patient_response = None
         self.current_context = None
         self.debug = False
+        # Generate the next question from the pre-turn EHR while extraction runs
+        self.speculative = False
+        self.speculation_stats = {"kept": 0, "regenerated": 0}
+        # Optional ExtractionCache and ThaiFastExtractor shared between sessions
+        self.extraction_cache = None
+        self.fast_extractor = None
+        # "text" parses free-form JSON, "structured" binds EHRModel through the provider's structured output,
+        # "patch" asks for changed fields only and merges them with EHRModel.apply_patch
+        self.extraction_mode = "text"
+        self._structured_client_cache = None
+        # "single" asks about one missing field per turn, "grouped" about the still missing fields of its field_groups entry
+        self.question_planning = "single"
+        self.question_targets = []
+        self.question_plan_stats = {"questions": 0, "all_filled": 0, "partially_filled": 0, "none_filled": 0}
+        # Run the final refactor_ehr pass as a job and return the closing message right away
+        self.background_refactor = False
+        self.refactor_job = None
         self.current_prompt = None
         self.current_prompt_ehr = None
         self.current_question = None
-        self.ending_text = "ขอบคุณที่ให้ข้อมูลค่ะ ฉันได้ข้อมูลที่ต้องการครบแล้วค่ะ ดิฉันจะบันทึกข้อมูลทั้งหมดนี้เพื่อส่งต่อให้แพทย์ดูแลคุณอย่างเหมาะสมค่ะ"
+        self.ending_text = ENDING_TEXT
         
     def create_prompt(self, task_type):
-        if task_type == "extract_ehr":
-          system_instruction = self.TASK_INSTRUCTIONS.get("extract_ehr")
+        # Templates are parsed once at import by the registry, this only looks them up
+        return PROMPTS.get(task_type)
 
-        elif task_type == "question":
-          system_instruction = self.TASK_INSTRUCTIONS.get("question")
+    def gather_ehr(self, patient_response, max_retries=2):
+        with STAGE_SECONDS.time(stage="gather_ehr", model=self.model_name):
+            return self._gather_ehr(patient_response, max_retries)
 
-        elif task_type == "refactor":
-          system_instruction = self.TASK_INSTRUCTIONS.get("refactor")
+    async def agather_ehr(self, patient_response, max_retries=2):
+        with STAGE_SECONDS.time(stage="gather_ehr", model=self.model_name):
+            return await self._agather_ehr(patient_response, max_retries)
 
-        else:
-          raise ValueError("Invalid task type.")
+    def _invoke(self, client, messages, stage):
+        with STAGE_SECONDS.time(stage=stage, model=self.model_name):
+            response = client.invoke(messages)
+        record_usage(response["raw"] if isinstance(response, dict) else response, self.model_name, stage)
+        return response
 
-        # system + user
-        system_template = SystemMessagePromptTemplate.from_template(system_instruction)
-        user_template = HumanMessagePromptTemplate.from_template("response: {patient_response}")
-        prompt = ChatPromptTemplate.from_messages([system_template, user_template])
-        return prompt
+    async def _ainvoke(self, client, messages, stage):
+        with STAGE_SECONDS.time(stage=stage, model=self.model_name):
+            response = await client.ainvoke(messages)
+        record_usage(response["raw"] if isinstance(response, dict) else response, self.model_name, stage)
+        return response
 
-    def gather_ehr(self, patient_response, max_retries=2):
-        prompt = self.create_prompt("extract_ehr")
-        messages = prompt.format_messages(ehr_data=self.ehr_data, patient_response=patient_response, example=self.JSON_EXAMPLE)
-        self.current_prompt_ehr = messages[0].content
-        response = self.client(messages=messages)
+    def _gather_ehr(self, patient_response, max_retries):
+        fast_ehr = self._fast_extract(patient_response)
+        if fast_ehr is not None:
+            return fast_ehr
+
+        cache_key = self._extraction_cache_key(patient_response)
+        cached = self._cached_ehr(cache_key)
+        if cached is not None:
+            return cached
+
+        messages = self._ehr_messages(patient_response)
+        if self.extraction_mode == "structured":
+            return self._update_ehr_structured(self._invoke(self._structured_client(), messages, "extract_ehr"), cache_key)
+
+        response = self._invoke(self.client, messages, "extract_ehr")
         if self.debug:
             pprint(f"gather ehr llm response: \n{response.content}\n")
         
         retry_count = 0
         while retry_count < max_retries:
             try:
-                json_content = self.extract_json_content(response.content)
-                if self.debug:
-                    pprint(f"JSON after dumps:\n{json_content}\n")
-                ehr_data = EHRModel.model_validate_json(json_content)
+                return self._update_ehr(response, cache_key)
+
+            except ValueError as e:  # includes ValidationError and JSONDecodeError
+                print(f"Error parsing EHR data: {e} Retrying {retry_count}...")
+                retry_count += 1
+
+                if retry_count < max_retries:
+                    messages = self._ehr_retry_messages(patient_response, response, retry_count, max_retries)
+                    EXTRACTION_RETRIES.inc(model=self.model_name)
+                    response = self._invoke(self.client, messages, "extraction_retry")
+
+        # Final error message if retries are exhausted
+        print("Failed to extract valid EHR data after multiple attempts. Generating new question.")
+        return {"result": response, "error": "Failed to extract valid EHR data. Please try again."}
+
+    async def _agather_ehr(self, patient_response, max_retries):
+        fast_ehr = self._fast_extract(patient_response)
+        if fast_ehr is not None:
+            return fast_ehr
+
+        cache_key = self._extraction_cache_key(patient_response)
+        cached = self._cached_ehr(cache_key)
+        if cached is not None:
+            return cached
 
-                # Update only missing parameters
-                for key, value in ehr_data.model_dump().items():
-                    if value not in [None, [], {}]:  # Checks for None and empty lists or dicts
-                        print(f"Updating {key} with value {value}")
-                        self.ehr_data[key] = value
+        messages = self._ehr_messages(patient_response)
+        if self.extraction_mode == "structured":
+            return self._update_ehr_structured(await self._ainvoke(self._structured_client(), messages, "extract_ehr"), cache_key)
 
-                return self.ehr_data
+        response = await self._ainvoke(self.client, messages, "extract_ehr")
+        if self.debug:
+            pprint(f"gather ehr llm response: \n{response.content}\n")
 
-            except (ValidationError, json.JSONDecodeError) as e:
+        retry_count = 0
+        while retry_count < max_retries:
+            try:
+                return self._update_ehr(response, cache_key)
+
+            except ValueError as e:  # includes ValidationError and JSONDecodeError
                 print(f"Error parsing EHR data: {e} Retrying {retry_count}...")
                 retry_count += 1
 
                 if retry_count < max_retries:
-                    retry_prompt = (
-                        "กรุณาตรวจสอบให้แน่ใจว่าข้อมูลที่ให้มาอยู่ในรูปแบบ JSON ที่ถูกต้องตามโครงสร้างตัวอย่าง "
-                        "และแก้ไขปัญหาทางไวยากรณ์หรือรูปแบบที่ไม่ถูกต้อง รวมถึงให้ข้อมูลในรูปแบบที่สอดคล้องกัน "
-                        "ห้ามมีการ hallucination หากไม่เจอข้อมูลให้ใส่ค่า null "
-                        f"Attempt {retry_count + 1} of {max_retries}."
-                    )
-                    messages = self.create_prompt("extract_ehr") + "\n\n# ลองใหม่: \n\n{retry_prompt} \n ## JSON เก่าที่มีปัญหา: \n{json_problem}"
-                    messages = messages.format_messages(
-                        ehr_data = self.ehr_data,
-                        patient_response=patient_response, 
-                        example=self.JSON_EXAMPLE, 
-                        retry_prompt=retry_prompt,
-                        json_problem=json_content
-                    )
-                    self.current_prompt_ehr = messages[0].content
-                    print(f"กำลังลองใหม่ด้วย prompt ที่ปรับแล้ว: {retry_prompt}")
-                    response = self.client(messages=messages)
+                    messages = self._ehr_retry_messages(patient_response, response, retry_count, max_retries)
+                    EXTRACTION_RETRIES.inc(model=self.model_name)
+                    response = await self._ainvoke(self.client, messages, "extraction_retry")
 
-        # Final error message if retries are exhausted
         print("Failed to extract valid EHR data after multiple attempts. Generating new question.")
         return {"result": response, "error": "Failed to extract valid EHR data. Please try again."}
 
-    def fetching_chat(self, patient_response, question_prompt):
-        for field, description in self.field_descriptions.items():
-            # Find the next missing field and generate a question
-            if field not in self.ehr_data or not self.ehr_data[field]:
-                # Compile known patient information as context
-                context = ", ".join(
-                    f"{key}: {value}" for key, value in self.ehr_data.items() if value
-                )
-                print("fetching for ", f'"{field}":"{description}"')
-                history_context = "\n".join(
-                    f"{entry['role']}: {entry['content']}" for entry in self.chat_history
-                )
-                messages = ChatPromptTemplate.from_messages([question_prompt, history_context])
-                messages = messages.format_messages(
-                    description=f'"{field}":"{description}"', 
-                    context=context, 
-                    patient_response=patient_response, 
-                    field_descriptions=self.field_descriptions,
-                    time_now=time.strftime("%Y-%m-%d %H:%M:%S")
-                )
-                self.current_context = context
-                self.current_prompt = messages[0].content
-
-                start_time = time.time()
-                response = self.client(messages=messages)
-                print(f"Time after getting response from client: {time.time() - start_time} seconds")
-
-                # Store generated question in chat history and return it
-                self.current_question = response.content.strip()
-                
-                return self.current_question
+    def _ehr_messages(self, patient_response):
+        messages = PROMPTS.format(self._extraction_task(), ehr_data=self.ehr_data, patient_response=patient_response, example=self.JSON_EXAMPLE)
+        self.current_prompt_ehr = messages[0].content
+        return messages
+
+    def _extraction_task(self):
+        # Patch mode asks only for changed fields instead of the whole record
+        return "extract_ehr_patch" if self.extraction_mode == "patch" else "extract_ehr"
+
+    def _ehr_retry_messages(self, patient_response, response, retry_count, max_retries):
+        json_content = self.extract_json_content(response.content)
+        retry_prompt = (
+            "กรุณาตรวจสอบให้แน่ใจว่าข้อมูลที่ให้มาอยู่ในรูปแบบ JSON ที่ถูกต้องตามโครงสร้างตัวอย่าง "
+            "และแก้ไขปัญหาทางไวยากรณ์หรือรูปแบบที่ไม่ถูกต้อง รวมถึงให้ข้อมูลในรูปแบบที่สอดคล้องกัน "
+            "ห้ามมีการ hallucination หากไม่เจอข้อมูลให้ใส่ค่า null "
+            f"Attempt {retry_count + 1} of {max_retries}."
+        )
+        messages = PROMPTS.format(
+            f"{self._extraction_task()}_retry",
+            ehr_data = self.ehr_data,
+            patient_response=patient_response, 
+            example=self.JSON_EXAMPLE, 
+            retry_prompt=retry_prompt,
+            json_problem=json_content
+        )
+        self.current_prompt_ehr = messages[0].content
+        print(f"กำลังลองใหม่ด้วย prompt ที่ปรับแล้ว: {retry_prompt}")
+        return messages
+
+    def _fast_extract(self, patient_response):
+        if self.fast_extractor is None:
+            return None
+        fields = self.fast_extractor.extract(
+            patient_response, expected_field=self._next_missing_field(), ehr_data=self.ehr_snapshot()
+        )
+        if fields is None:
+            return None
+        FAST_EXTRACT.inc()
+        for key, value in fields.items():
+            print(f"Updating {key} with value {value} (fast path)")
+            self.ehr_data[key] = value
+        return self.ehr_data
+
+    def _extraction_cache_key(self, patient_response):
+        if self.extraction_cache is None:
+            return None
+        return self.extraction_cache.make_key(self.ehr_data, patient_response, self.model_name)
+
+    def _cached_ehr(self, cache_key):
+        if cache_key is None:
+            return None
+        json_content = self.extraction_cache.get(cache_key)
+        EXTRACTION_CACHE.inc(result="miss" if json_content is None else "hit")
+        if json_content is None:
+            return None
+        print("Extraction cache hit, skipping LLM call")
+        return self._apply_ehr(EHRModel.model_validate_json(json_content))
+
+    def _update_ehr(self, response, cache_key=None):
+        ehr_data = self._parse_ehr(response.content)
+        if self.extraction_mode == "patch":
+            ehr_data = EHRModel.model_validate(self.ehr_data).apply_patch(ehr_data)
+        return self._apply_ehr(ehr_data, cache_key)
+
+    def _update_ehr_structured(self, result, cache_key=None):
+        raw = result["raw"]
+        if self.debug:
+            pprint(f"gather ehr structured response: \n{raw}\n")
+        ehr_data = result.get("parsed")
+        if ehr_data is None:
+            # Repair locally instead of spending another round trip on a retry prompt
+            print(f"Structured output did not validate: {result.get('parsing_error')}")
+            ehr_data = self._repair_structured(raw)
+        if ehr_data is None:
+            print("Failed to extract valid EHR data from structured output. Generating new question.")
+            return {"result": raw, "error": "Failed to extract valid EHR data. Please try again."}
+        return self._apply_ehr(ehr_data, cache_key)
+
+    def _repair_structured(self, raw):
+        for tool_call in getattr(raw, "tool_calls", None) or []:
+            ehr_data = coerce_ehr(tool_call.get("args"))
+            if ehr_data is not None:
+                return ehr_data
+        for tool_call in getattr(raw, "invalid_tool_calls", None) or []:
+            ehr_data = coerce_ehr(repair_json(tool_call.get("args")))
+            if ehr_data is not None:
+                return ehr_data
+        if isinstance(raw.content, str):
+            return coerce_ehr(repair_json(raw.content))
+        return None
+
+    def _structured_client(self):
+        if self._structured_client_cache is None or self._structured_client_cache[0] is not self.client:
+            method = model_list.get(self.model_name, {}).get("structured_output", "function_calling")
+            structured = self.client.with_structured_output(EHRModel, method=method, include_raw=True)
+            self._structured_client_cache = (self.client, structured)
+        return self._structured_client_cache[1]
+
+    def _parse_ehr(self, content):
+        json_content = self.extract_json_content(content)
+        if self.debug:
+            pprint(f"JSON after dumps:\n{json_content}\n")
+        try:
+            if json_content is None:
+                raise ValueError("No valid JSON found in response")
+            return EHRModel.model_validate_json(json_content)
+        except ValueError as e:
+            ehr_data = coerce_ehr(repair_json(content))
+            if ehr_data is None:
+                raise
+            print(f"Repaired malformed EHR JSON instead of retrying: {e}")
+            return ehr_data
+
+    def _apply_ehr(self, ehr_data, cache_key=None):
+        if cache_key is not None:
+            self.extraction_cache.set(cache_key, ehr_data.model_dump_json())
+
+        # Update only missing parameters
+        for key, value in ehr_data.model_dump().items():
+            if value not in [None, [], {}]:  # Checks for None and empty lists or dicts
+                print(f"Updating {key} with value {value}")
+                self.ehr_data[key] = value
+
+        return self.ehr_data
+
+    def fetching_chat(self, patient_response, question_prompt, ehr_data=None):
+        messages = self._question_messages(patient_response, question_prompt, ehr_data)
+        if messages is None:
+            return None
+
+        response = self._invoke(self.client, messages, "fetching_chat")
+
+        # Store generated question in chat history and return it
+        self.current_question = response.content.strip()
+        return self.current_question
+
+    async def afetching_chat(self, patient_response, question_prompt, ehr_data=None):
+        messages = self._question_messages(patient_response, question_prompt, ehr_data)
+        if messages is None:
+            return None
+
+        response = await self._ainvoke(self.client, messages, "fetching_chat")
+
+        self.current_question = response.content.strip()
+        return self.current_question
+
+    def _next_missing_field(self, ehr_data=None):
+        ehr_data = self.ehr_data if ehr_data is None else ehr_data
+        for field in self.field_descriptions:
+            if field not in ehr_data or not ehr_data[field]:
+                return field
+        return None
+
+    def _question_targets(self, ehr_data):
+        field = self._next_missing_field(ehr_data)
+        if field is None or self.question_planning != "grouped":
+            return [field] if field else []
+        group = next((group for group in field_groups if field in group), (field,))
+        return [f for f in group if f not in ehr_data or not ehr_data[f]]
+
+    def _score_question_plan(self, targets):
+        # How many of the fields the previous question asked about were filled by the answer
+        if not targets:
+            return
+        ehr_data = self.ehr_snapshot()
+        filled = sum(1 for field in targets if ehr_data.get(field))
+        result = "all_filled" if filled == len(targets) else "partially_filled" if filled else "none_filled"
+        self.question_plan_stats["questions"] += 1
+        self.question_plan_stats[result] += 1
+        QUESTION_PLAN.inc(planning=self.question_planning, result=result)
+        QUESTION_PLAN_FIELDS.inc(len(targets), planning=self.question_planning, outcome="targeted")
+        QUESTION_PLAN_FIELDS.inc(filled, planning=self.question_planning, outcome="filled")
+
+    def _question_messages(self, patient_response, question_prompt, ehr_data=None):
+        ehr_data = self.ehr_data if ehr_data is None else ehr_data
+        # Find the next missing field, or group of fields, and generate a question
+        targets = self._question_targets(ehr_data)
+        self.question_targets = targets
+        if not targets:
+            return None
+        # Compile known patient information as context
+        context = ", ".join(
+            f"{key}: {value}" for key, value in ehr_data.items() if value
+        )
+        description = ", ".join(f'"{field}":"{self.field_descriptions[field]}"' for field in targets)
+        if len(targets) > 1:
+            description += GROUPED_QUESTION_NOTE
+        print("fetching for ", description)
+        history_context = self.history.render()
+        messages = question_prompt.format_messages(
+            description=description, 
+            context=context, 
+            patient_response=patient_response, 
+            field_descriptions=self.field_descriptions,
+            time_now=time.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        # The transcript is sent verbatim, never parsed as a template
+        messages.append(HumanMessage(content=history_context))
+        self.current_context = context
+        self.current_prompt = messages[0].content
+        return messages
             
     def refactor_ehr(self, current_question=None):
         patient_response = current_question or self.ending_text
-        refactor_prompt = self.create_prompt("refactor")
-        messages = ChatPromptTemplate.from_messages([refactor_prompt])
-        messages = messages.format_messages(patient_response="", ehr_data=self.ehr_data, chat_history=self.chat_history, time_now=time.strftime("%Y-%m-%d %H:%M:%S"))
-        response = self.client(messages=messages)
-        json_content = self.extract_json_content(response.content)
-        pprint(f"JSON after dumps:\n{json_content}\n")
-        self.ehr_data = EHRModel.model_validate_json(json_content)
-        print("Refactored EHR data ! Ending the process.")
+        response = self._invoke(self.client, self._refactor_messages(), "refactor_ehr")
+        self._apply_refactor(response)
         return patient_response
+
+    async def arefactor_ehr(self, current_question=None):
+        patient_response = current_question or self.ending_text
+        response = await self._ainvoke(self.client, self._refactor_messages(), "refactor_ehr")
+        self._apply_refactor(response)
+        return patient_response
+
+    def _refactor_messages(self):
+        return PROMPTS.format("refactor", patient_response="", ehr_data=self.ehr_data, chat_history=self.history.render(), time_now=time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    def _apply_refactor(self, response):
+        self.ehr_data = self._parse_ehr(response.content).model_dump()
+        print("Refactored EHR data ! Ending the process.")
+
+    def collect_refactor(self):
+        """Apply the background refactor's EHR once it is done, call with the session lock held."""
+        job = self.refactor_job
+        if job is not None and not job.applied and job.status() == "done":
+            self.ehr_data = job.result()
+            job.applied = True
+            print("Refactored EHR data ! Ending the process.")
+        return self.ehr_data
+
+    def _finish_interview(self, question):
+        if not self.background_refactor:
+            return self.refactor_ehr(question)
+        # Snapshot the prompt now, the job must not see turns added after the ending
+        messages = self._refactor_messages()
+        self._start_refactor_job(_speculation_pool.submit(self._run_refactor, messages))
+        return question or self.ending_text
+
+    async def _afinish_interview(self, question):
+        if not self.background_refactor:
+            return await self.arefactor_ehr(question)
+        messages = self._refactor_messages()
+        self._start_refactor_job(asyncio.create_task(self._arun_refactor(messages)))
+        return question or self.ending_text
+
+    def _start_refactor_job(self, future):
+        if self.refactor_job is not None:
+            self.refactor_job.cancel()
+        self.refactor_job = RefactorJob(future)
+
+    def _run_refactor(self, messages):
+        # Runs outside the session lock, so it returns the EHR instead of setting it
+        try:
+            return self._parse_ehr(self._invoke(self.client, messages, "refactor_ehr").content).model_dump()
+        except Exception as e:
+            # The patient already has the closing message, keep the EHR gathered so far
+            print(f"Background refactor failed, keeping extracted EHR: {e!r}")
+            raise
+
+    async def _arun_refactor(self, messages):
+        try:
+            return self._parse_ehr((await self._ainvoke(self.client, messages, "refactor_ehr")).content).model_dump()
+        except Exception as e:
+            print(f"Background refactor failed, keeping extracted EHR: {e!r}")
+            raise
     
     def get_question(self, patient_response):
         question_prompt = self.create_prompt("question")
-        # Update EHR data with the latest patient response
-        start_time = time.time()
-        ehr_data = self.gather_ehr(patient_response)
-        print(f"Time after gathering EHR: {time.time() - start_time} seconds")
+        if self.speculative and self._next_missing_field() is not None:
+            question = self._speculative_question(patient_response, question_prompt)
+        else:
+            # Update EHR data with the latest patient response
+            ehr_data = self.gather_ehr(patient_response)
+
+            if self.debug:
+                pprint(ehr_data)
+
+            question = self.fetching_chat(patient_response, question_prompt)
+
+        if not question or self.ending_text in question:
+            question = self._finish_interview(question)
+        self.current_question = question
+        return self.current_question
+
+    async def aget_question(self, patient_response):
+        question_prompt = self.create_prompt("question")
+        if self.speculative and self._next_missing_field() is not None:
+            question = await self._aspeculative_question(patient_response, question_prompt)
+        else:
+            ehr_data = await self.agather_ehr(patient_response)
+
+            if self.debug:
+                pprint(ehr_data)
+
+            question = await self.afetching_chat(patient_response, question_prompt)
+
+        if not question or self.ending_text in question:
+            question = await self._afinish_interview(question)
+        self.current_question = question
+        return self.current_question
+
+    def _speculative_question(self, patient_response, question_prompt):
+        # Ask about the fields that are missing before this turn while the extraction runs
+        pre_turn_ehr = dict(self.ehr_data)
+        with STAGE_SECONDS.time(stage="speculative_turn", model=self.model_name):
+            extraction = _speculation_pool.submit(self.gather_ehr, patient_response)
+            try:
+                question = self.fetching_chat(patient_response, question_prompt, pre_turn_ehr)
+            finally:
+                ehr_data = extraction.result()
 
         if self.debug:
             pprint(ehr_data)
 
-        self.current_question = self.fetching_chat(patient_response, question_prompt) or self.refactor_ehr()
-        if self.ending_text in self.current_question:
-            return self.refactor_ehr(self.current_question)
-        return self.current_question
+        if self._reconcile_speculation(self.question_targets):
+            return question
+        return self.fetching_chat(patient_response, question_prompt)
+
+    async def _aspeculative_question(self, patient_response, question_prompt):
+        pre_turn_ehr = dict(self.ehr_data)
+        with STAGE_SECONDS.time(stage="speculative_turn", model=self.model_name):
+            extraction = asyncio.create_task(self.agather_ehr(patient_response))
+            try:
+                question = await self.afetching_chat(patient_response, question_prompt, pre_turn_ehr)
+            except BaseException:
+                extraction.cancel()
+                raise
+            ehr_data = await extraction
+
+        if self.debug:
+            pprint(ehr_data)
+
+        if self._reconcile_speculation(self.question_targets):
+            return question
+        return await self.afetching_chat(patient_response, question_prompt)
+
+    def _reconcile_speculation(self, targets):
+        # The speculative question is still valid unless extraction just filled a field it asks about
+        filled = [field for field in targets if self.ehr_data.get(field)]
+        if filled:
+            self.speculation_stats["regenerated"] += 1
+            print(f"Speculative question for {', '.join(filled)} is stale, regenerating")
+            return False
+        self.speculation_stats["kept"] += 1
+        return True
 
     def invoke(self, patient_response):
+        self.collect_refactor()
         if patient_response:
-            self.chat_history.append({"role": "user", "content": patient_response})
+            self.add_message("user", patient_response)
+        asked = self.question_targets
         question = self.get_question(patient_response)
+        self._score_question_plan(asked)
+        self.current_patient_response = patient_response
+        self.add_message("assistant", question)
+        return question
+
+    async def ainvoke(self, patient_response):
+        self.collect_refactor()
+        if patient_response:
+            self.add_message("user", patient_response)
+        asked = self.question_targets
+        question = await self.aget_question(patient_response)
+        self._score_question_plan(asked)
         self.current_patient_response = patient_response
-        self.chat_history.append({"role": "assistant", "content": question})
+        self.add_message("assistant", question)
         return question
     
+    async def astream(self, patient_response):
+        # Same turn as ainvoke, but yields the question token by token as the model produces it
+        self.collect_refactor()
+        if patient_response:
+            self.add_message("user", patient_response)
+        chunks = []
+        question = None
+        completed = False
+        try:
+            question_prompt = self.create_prompt("question")
+            asked = self.question_targets
+            ehr_data = await self.agather_ehr(patient_response)
+            self._score_question_plan(asked)
+
+            if self.debug:
+                pprint(ehr_data)
+
+            messages = self._question_messages(patient_response, question_prompt)
+            if messages is not None:
+                start_time = time.perf_counter()
+                usage = None
+                async with aclosing(self.client.astream(messages)) as stream:
+                    async for chunk in stream:
+                        usage = chunk if usage is None else usage + chunk
+                        if chunk.content:
+                            chunks.append(chunk.content)
+                            yield chunk.content
+                STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="fetching_chat", model=self.model_name)
+                record_usage(usage, self.model_name, "fetching_chat")
+                question = "".join(chunks).strip()
+
+            if not question:
+                question = await self._afinish_interview(question)
+                chunks.append(question)
+                yield question
+            elif self.ending_text in question:
+                question = await self._afinish_interview(question)
+            completed = True
+        finally:
+            if not completed:
+                # Cut off by a disconnect or an error, the turn ends with whatever the patient was sent
+                question = "".join(chunks).strip() or None
+            self.current_question = question
+            self.current_patient_response = patient_response
+            if question:
+                self.add_message("assistant", question)
+
     def slim_invoke(self, patient_response):
-        start_time = time.time()
-        user_message = HumanMessagePromptTemplate.from_template("response: {patient_response}")
-        print(f"Time after creating user_message: {time.time() - start_time} seconds")
+        from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 
-        start_time = time.time()
+        user_message = HumanMessagePromptTemplate.from_template("response: {patient_response}")
         messages = ChatPromptTemplate.from_messages([user_message]).format_messages(patient_response=patient_response)
-        print(f"Time after formatting messages: {time.time() - start_time} seconds")
-
-        start_time = time.time()
-        response = self.client(messages=messages)
-        print(f"Time after getting response from client: {time.time() - start_time} seconds")
+        response = self._invoke(self.client, messages, "slim_invoke")
 
         return response.content
 
@@ -194,7 +591,35 @@ class VirtualNurseLLM:
             print("No valid JSON found in response")
             return None
 
+    def add_message(self, role, content):
+        self.chat_history.append({"role": role, "content": content})
+        self.history.append(role, content)
+
+    def ehr_snapshot(self):
+        return dict(self.ehr_data)
+
+    def dump_state(self):
+        return {
+            "ehr_data": self.ehr_snapshot(),
+            "chat_history": list(self.chat_history),
+            "current_question": self.current_question,
+            "current_patient_response": self.current_patient_response,
+        }
+
+    def load_state(self, state):
+        self.reset()
+        for message in state["chat_history"]:
+            self.add_message(message["role"], message["content"])
+        self.ehr_data = dict(state["ehr_data"])
+        self.current_question = state["current_question"]
+        self.current_patient_response = state["current_patient_response"]
+
     def reset(self):
+        if self.refactor_job is not None:
+            self.refactor_job.cancel()
+            self.refactor_job = None
         self.ehr_data = {}
         self.chat_history = []
+        self.history = HistoryWindow(self.history_token_budget, self.history_summary_budget)
         self.current_question = None
+        self.question_targets = []
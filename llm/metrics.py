@@ -0,0 +1,125 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry = self._values[key]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "nurse_stage_duration_seconds", "Time spent in each stage of a nurse turn.", ("stage", "model")))
+TURN_SECONDS = REGISTRY.register(Histogram(
+    "nurse_turn_duration_seconds", "End-to-end time of a nurse turn.", ("endpoint", "model")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "nurse_llm_tokens_total", "Tokens reported by the provider.", ("model", "stage", "type")))
+EXTRACTION_RETRIES = REGISTRY.register(Counter(
+    "nurse_extraction_retries_total", "EHR extraction calls repeated after a parse failure.", ("model",)))
+EXTRACTION_CACHE = REGISTRY.register(Counter(
+    "nurse_extraction_cache_total", "Extraction cache lookups.", ("result",)))
+FAST_EXTRACT = REGISTRY.register(Counter(
+    "nurse_fast_extract_total", "Turns answered by the rule-based extractor without an LLM call.", ()))
+QUESTION_PLAN = REGISTRY.register(Counter(
+    "nurse_question_plan_total", "Answers to planned questions by how many of the targeted fields they filled.", ("planning", "result")))
+QUESTION_PLAN_FIELDS = REGISTRY.register(Counter(
+    "nurse_question_plan_fields_total", "Fields targeted by planned questions and how many were filled.", ("planning", "outcome")))
+
+
+def record_usage(message, model, stage):
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    # The router reports which backend actually answered
+    model = (getattr(message, "response_metadata", None) or {}).get("router_model", model)
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), model=model, stage=stage, type="prompt")
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), model=model, stage=stage, type="completion")
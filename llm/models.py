@@ -1,41 +1,89 @@
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from llm.http_pool import GROQ_BASE_URL, get_http_clients
 load_dotenv()
 
 model_list = {
     "typhoon-v1.5x-70b-instruct": {
         "model_name": "typhoon-v1.5x-70b-instruct",
         "model_type": "openai",
-        "base_url": "https://api.opentyphoon.ai/v1",
-        "api_key": os.getenv("TYPHOON_CHAT_KEY")
+        "base_url": os.getenv("TYPHOON_BASE_URL", "https://api.opentyphoon.ai/v1"),
+        "api_key": os.getenv("TYPHOON_CHAT_KEY"),
+        "structured_output": "json_mode"
     },
     "openthaigpt": {
         "model_name": ".",
         "model_type": "openai",
-        "base_url": "https://api.aieat.or.th/v1",
-        "api_key": "dummy"
+        "base_url": os.getenv("OPENTHAIGPT_BASE_URL", "https://api.aieat.or.th/v1"),
+        "api_key": "dummy",
+        "structured_output": "json_mode"
     },
     "llama-3.3-70b-versatile": {
         "model_name": "llama-3.3-70b-versatile",
         "model_type": "groq",
-        "base_url": None,
-        "api_key": os.getenv("GROQ_CHAT_KEY")
+        "base_url": os.getenv("GROQ_BASE_URL", GROQ_BASE_URL),
+        "api_key": os.getenv("GROQ_CHAT_KEY"),
+        "structured_output": "function_calling"
+    },
+    "router": {
+        "model_name": "router",
+        "model_type": "router",
+        "models": ["typhoon-v1.5x-70b-instruct", "openthaigpt", "llama-3.3-70b-versatile"],
+        "structured_output": "json_mode"
     }
 }
 
+_model_cache = {}
+
 def get_model(model_name, base_url=None, api_key=None):
+    # Chat models are stateless, so one instance per configuration is shared by every session
+    key = (model_name, base_url, api_key)
+    if key not in _model_cache:
+        _model_cache[key] = _build_model(model_name, base_url, api_key)
+    return _model_cache[key]
+
+def cached_model(model_name):
+    return _model_cache.get((model_name, None, None))
+
+def _build_model(model_name, base_url=None, api_key=None):
+    if model_list[model_name]["model_type"] == "router":
+        from llm.router import ModelRouter
+        # Backends without credentials would fail to construct, route between the configured ones
+        backends = [name for name in model_list[model_name]["models"] if model_list[name]["api_key"]]
+        if not backends:
+            raise ValueError("No router backend has an API key configured.")
+        return ModelRouter(
+            models={name: get_model(name) for name in backends},
+            hedge_percentile=float(os.getenv("ROUTER_HEDGE_PERCENTILE", 0.95)),
+            default_hedge_delay=float(os.getenv("ROUTER_DEFAULT_HEDGE_DELAY", 3.0)),
+        )
     api_key = api_key or model_list[model_name]["api_key"]
     base_url = base_url or model_list[model_name]["base_url"]
     model = model_list[model_name]["model_name"]
     model_type = model_list[model_name]["model_type"]
+    # Provider packages are imported on first use, only the configured ones are ever loaded
     if model_type == "openai":
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = get_http_clients(base_url)
         return ChatOpenAI(
             temperature=0.3,
             timeout=15,
-            base_url= base_url, model=model, api_key=api_key, max_retries=0)
+            base_url= base_url, model=model, api_key=api_key, max_retries=0,
+            http_client=http_client, http_async_client=http_async_client)
     elif model_type == "groq":
-        return ChatGroq(temperature=0.3, timeout=15, groq_api_key=api_key, model_name=model,max_retries=0)
+        from langchain_groq import ChatGroq
+        http_client, http_async_client = get_http_clients(base_url)
+        return ChatGroq(temperature=0.3, timeout=15, groq_api_key=api_key, model_name=model,max_retries=0, base_url=base_url,
+                        http_client=http_client, http_async_client=http_async_client)
     else:
-        raise ValueError("Invalid model type. Supported types are 'openai' and 'groq'.")
\ No newline at end of file
+        raise ValueError("Invalid model type. Supported types are 'openai' and 'groq'.")
+
+def warm_up_probes():
+    # base_url -> URL to request when opening the pooled connection at startup
+    probes = {}
+    for config in model_list.values():
+        if config["model_type"] == "openai" and config["api_key"]:
+            probes[config["base_url"]] = f"{config['base_url'].rstrip('/')}/models"
+        elif config["model_type"] == "groq" and config["api_key"]:
+            probes[config["base_url"]] = f"{config['base_url'].rstrip('/')}/openai/v1/models"
+    return probes
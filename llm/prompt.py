@@ -217,6 +217,33 @@ TASK_INSTRUCTIONS = {
       "### Output ที่ต้องการ:\n"
       "- JSON ใหม่ที่ตรวจสอบและปรับปรุงเรียบร้อยแล้ว\n"
       "* ไม่มีการให้ข้อมูลอื่นนอกเหนือจาก JSON *"
+  ),
+
+  # parameter: ehr_data, example
+  "extract_ehr_patch": (
+      "คุณคือเครื่องมือวิเคราะห์คำตอบของผู้ป่วย ดึงข้อมูลใหม่สำหรับเวชระเบียนอิเล็กทรอนิกส์ (EHR). "
+      "มีการปรับปรุงและเรียบเรียงข้อมูลเป็นภาษาแพทย์หรือใช้ศัพท์ทางการแพทย์เพื่อให้แพทย์สามารถอ่านได้ง่าย.\n\n"
+
+      "# ข้อมูลที่มีอยู่แล้ว:\n"
+      "{ehr_data}\n\n"
+
+      "# การทำงาน\n"
+      "- ส่งคืน *เฉพาะฟิลด์ที่เปลี่ยนแปลงหรือเพิ่มขึ้นใหม่* จากคำตอบล่าสุดของผู้ป่วย ห้ามส่งข้อมูลเดิมที่ไม่เปลี่ยนแปลงกลับมา\n"
+      "- ฟิลด์ประเภท list (chief_complaint, present_illness, past_illness, family_history, personal_history) "
+        "ให้ใส่เฉพาะรายการใหม่ ระบบจะนำไปต่อท้ายรายการเดิมเอง\n"
+      "- ฟิลด์ name, age, gender ให้ใส่ค่าใหม่เมื่อผู้ป่วยให้ข้อมูลหรือแก้ไขข้อมูล ค่าใหม่จะแทนที่ค่าเดิม\n"
+      "- หากคำตอบไม่มีข้อมูลใหม่ ให้ส่งคืน {{}}\n"
+      "- ห้ามมีการ hallucination หรือเพิ่มข้อมูลที่ไม่เกี่ยวข้อง\n\n"
+
+      "# ชื่อฟิลด์และชนิดข้อมูล:\n"
+      "{example}\n\n"
+
+      "# ตัวอย่าง\n"
+      "ข้อมูลเดิม: {{\"age\": 50, \"chief_complaint\": [\"ไอแห้ง\"]}}\n"
+      "คำตอบ: มีปวดหัวด้วยครับ เป็นมาสองวันแล้ว\n"
+      "ผลลัพธ์: {{\"chief_complaint\": [\"ปวดศีรษะ\"], \"present_illness\": [\"ปวดศีรษะมา 2 วัน\"]}}\n\n"
+
+      "ส่งคืนคำตอบในรูปแบบ JSON object ที่ถูกต้องเท่านั้น โดยไม่มีคำอธิบายอื่น."
   )
 
 }
@@ -230,4 +257,18 @@ field_descriptions = {
     "past_illness": "ประวัติการเจ็บป่วยหรืออาการแพ้ในอดีตที่ผู้ป่วยมี",
     "family_history": "ประวัติสุขภาพในครอบครัวของผู้ป่วย",
     "personal_history": "ข้อมูลสุขภาพส่วนตัว เช่น ลักษณะการนอนหลับหรือยาที่ผู้ป่วยทานอยู่"
-}
\ No newline at end of file
+}
+
+# Fields that can be asked together in one natural question when question planning is "grouped".
+# Symptoms stay on their own so they are still explored one at a time as the question prompt asks.
+field_groups = [
+    ("name", "age", "gender"),
+    ("chief_complaint",),
+    ("present_illness",),
+    ("past_illness", "family_history"),
+    ("personal_history",),
+]
+GROUPED_QUESTION_NOTE = " (ถามข้อมูลเหล่านี้รวมกันในคำถามเดียวอย่างเป็นธรรมชาติ)"
+
+GREETING_TEXT = "สวัสดีค่ะ ดิฉัน มะลิ เป็นพยาบาลเสมือนที่จะมาดูแลการซักประวัตินะคะ"
+ENDING_TEXT = "ขอบคุณที่ให้ข้อมูลค่ะ ฉันได้ข้อมูลที่ต้องการครบแล้วค่ะ ดิฉันจะบันทึกข้อมูลทั้งหมดนี้เพื่อส่งต่อให้แพทย์ดูแลคุณอย่างเหมาะสมค่ะ"
@@ -0,0 +1,97 @@
+from string import Formatter
+from langchain_core.messages import HumanMessage, SystemMessage
+from llm.prompt import TASK_INSTRUCTIONS
+
+USER_TEMPLATE = "response: {patient_response}"
+RETRY_TEMPLATE = "\n\n# ลองใหม่: \n\n{retry_prompt} \n ## JSON เก่าที่มีปัญหา: \n{json_problem}"
+
+
+def template_variables(template):
+    return {field for _, field, _, _ in Formatter().parse(template) if field is not None}
+
+
+class CompiledPrompt:
+    """A system + human prompt parsed and validated once.
+
+    `format_messages` formats the raw strings directly instead of going
+    through the LangChain template machinery on every turn.
+    """
+
+    def __init__(self, name, system_template, human_templates, input_variables):
+        self.name = name
+        self._parts = [(SystemMessage, system_template)] + [(HumanMessage, t) for t in human_templates]
+        self.input_variables = frozenset(input_variables)
+
+        found = set()
+        for _, template in self._parts:
+            found |= template_variables(template)
+        if found != self.input_variables:
+            raise ValueError(
+                f"Prompt '{name}' expects {sorted(self.input_variables)} but its templates use {sorted(found)}"
+            )
+
+    def format_messages(self, **kwargs):
+        missing = self.input_variables - kwargs.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' is missing variables: {sorted(missing)}")
+        return [message_cls(content=template.format(**kwargs)) for message_cls, template in self._parts]
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._prompts = {}
+
+    def register(self, name, system_template, human_templates, input_variables):
+        self._prompts[name] = CompiledPrompt(name, system_template, human_templates, input_variables)
+        return self._prompts[name]
+
+    def get(self, name):
+        try:
+            return self._prompts[name]
+        except KeyError:
+            raise ValueError("Invalid task type.")
+
+    def format(self, name, **kwargs):
+        return self.get(name).format_messages(**kwargs)
+
+    def __contains__(self, name):
+        return name in self._prompts
+
+
+PROMPTS = PromptRegistry()
+PROMPTS.register(
+    "extract_ehr",
+    TASK_INSTRUCTIONS["extract_ehr"],
+    [USER_TEMPLATE],
+    {"ehr_data", "example", "patient_response"},
+)
+PROMPTS.register(
+    "extract_ehr_retry",
+    TASK_INSTRUCTIONS["extract_ehr"],
+    [USER_TEMPLATE, RETRY_TEMPLATE],
+    {"ehr_data", "example", "patient_response", "retry_prompt", "json_problem"},
+)
+PROMPTS.register(
+    "extract_ehr_patch",
+    TASK_INSTRUCTIONS["extract_ehr_patch"],
+    [USER_TEMPLATE],
+    {"ehr_data", "example", "patient_response"},
+)
+PROMPTS.register(
+    "extract_ehr_patch_retry",
+    TASK_INSTRUCTIONS["extract_ehr_patch"],
+    [USER_TEMPLATE, RETRY_TEMPLATE],
+    {"ehr_data", "example", "patient_response", "retry_prompt", "json_problem"},
+)
+PROMPTS.register(
+    "question",
+    TASK_INSTRUCTIONS["question"],
+    [USER_TEMPLATE],
+    {"description", "context", "field_descriptions", "time_now", "patient_response"},
+)
+PROMPTS.register(
+    "refactor",
+    TASK_INSTRUCTIONS["refactor"],
+    [USER_TEMPLATE],
+    {"ehr_data", "chat_history", "time_now", "patient_response"},
+)
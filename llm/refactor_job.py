@@ -0,0 +1,51 @@
+import time
+
+
+class RefactorJob:
+    """Status of the final refactor_ehr pass running in the background.
+
+    Wraps either an asyncio.Task or a concurrent.futures.Future, both of
+    which expose done/cancelled/exception and add_done_callback. The job
+    only computes the refactored EHR, the session applies it under its lock
+    (see VirtualNurseLLM.collect_refactor).
+    """
+
+    def __init__(self, future):
+        self.future = future
+        self.started_at = time.time()
+        self.finished_at = None
+        self.applied = False
+        future.add_done_callback(self._finished)
+
+    def _finished(self, _):
+        self.finished_at = time.time()
+
+    def status(self):
+        if not self.future.done():
+            return "running"
+        if self.future.cancelled():
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def result(self):
+        """The refactored EHR as a dict once the job is done, else None."""
+        if self.status() != "done":
+            return None
+        return self.future.result()
+
+    def error(self):
+        if self.status() != "failed":
+            return None
+        return repr(self.future.exception())
+
+    def cancel(self):
+        self.future.cancel()
+
+    def snapshot(self):
+        return {
+            "status": self.status(),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": (self.finished_at or time.time()) - self.started_at,
+            "error": self.error(),
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from operator import itemgetter
+from typing import Any, Dict, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessageChunk
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableMap, RunnablePassthrough
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ModelStats:
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for success, False for error
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency=None, error=False, cancelled=False):
+        with self._lock:
+            self.requests += 1
+            if cancelled:
+                self.cancelled += 1
+                return
+            self.outcomes.append(not error)
+            if error:
+                self.errors += 1
+            else:
+                self.latencies.append(latency)
+
+    def error_rate(self):
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def latency(self, q, default=None):
+        with self._lock:
+            if not self.latencies:
+                return default
+            return percentile(self.latencies, q)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate(),
+            "p50": self.latency(0.5),
+            "p95": self.latency(0.95),
+            "p99": self.latency(0.99),
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "cancelled": self.cancelled,
+        }
+
+
+class ModelRouter(BaseChatModel):
+    """Chat model that routes each request across interchangeable backends.
+
+    Backends are ranked by their rolling error rate and median latency. The
+    request goes to the best one; if it has not answered by its
+    `hedge_percentile` latency, a duplicate is sent to the next backend and
+    whichever answers first wins while the other is cancelled. A failing
+    backend falls through to the next one.
+    """
+
+    models: Dict[str, Any]
+    hedge_percentile: float = 0.95
+    # Used until a backend has `min_samples` latencies recorded
+    default_hedge_delay: float = 3.0
+    min_hedge_delay: float = 0.2
+    min_samples: int = 5
+    window: int = 100
+    max_workers: int = 16
+
+    _stats: Dict[str, ModelStats] = PrivateAttr(default_factory=dict)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        self._stats = {name: ModelStats(self.window) for name in self.models}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="router")
+
+    @property
+    def _llm_type(self):
+        return "model-router"
+
+    @property
+    def _identifying_params(self):
+        return {"models": list(self.models), "hedge_percentile": self.hedge_percentile}
+
+    def stats(self):
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def ranked(self):
+        def score(name):
+            stats = self._stats[name]
+            return (stats.error_rate() > 0.5, stats.latency(0.5, self.default_hedge_delay) * (1 + stats.error_rate()))
+        return sorted(self.models, key=score)
+
+    def hedge_delay(self, name):
+        stats = self._stats[name]
+        if len(stats.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, stats.latency(self.hedge_percentile))
+
+    def _result(self, name, message):
+        self._stats[name].wins += 1
+        message.response_metadata["router_model"] = name
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _call(self, name, messages, stop, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            message = self.models[name].invoke(messages, stop=stop, **kwargs)
+        except Exception:
+            self._stats[name].record(error=True)
+            raise
+        self._stats[name].record(latency=time.perf_counter() - start_time)
+        return message
+
+    async def _acall(self, name, messages, stop, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            message = await self.models[name].ainvoke(messages, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            self._stats[name].record(cancelled=True)
+            raise
+        except Exception:
+            self._stats[name].record(error=True)
+            raise
+        self._stats[name].record(latency=time.perf_counter() - start_time)
+        return message
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        candidates = deque(self.ranked())
+        pending = {}
+        error = None
+        while True:
+            if not pending:
+                if not candidates:
+                    raise error
+                name = candidates.popleft()
+                pending[self._executor.submit(self._call, name, messages, stop, **kwargs)] = name
+                primary = name
+            # Only hedge while a single request is in flight, on the primary's percentile deadline
+            timeout = self.hedge_delay(primary) if candidates and len(pending) == 1 else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                name = candidates.popleft()
+                self._stats[primary].hedges += 1
+                print(f"Router: {primary} slower than {timeout:.2f}s, hedging with {name}")
+                pending[self._executor.submit(self._call, name, messages, stop, **kwargs)] = name
+                continue
+            for future in done:
+                name = pending.pop(future)
+                if future.exception() is None:
+                    # Threads cannot be interrupted, the loser's answer is simply ignored
+                    for loser in pending:
+                        loser.cancel()
+                    return self._result(name, future.result())
+                error = future.exception()
+                print(f"Router: {name} failed: {error}")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        candidates = deque(self.ranked())
+        pending = {}
+        error = None
+        try:
+            while True:
+                if not pending:
+                    if not candidates:
+                        raise error
+                    name = candidates.popleft()
+                    pending[asyncio.create_task(self._acall(name, messages, stop, **kwargs))] = name
+                    primary = name
+                timeout = self.hedge_delay(primary) if candidates and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    name = candidates.popleft()
+                    self._stats[primary].hedges += 1
+                    print(f"Router: {primary} slower than {timeout:.2f}s, hedging with {name}")
+                    pending[asyncio.create_task(self._acall(name, messages, stop, **kwargs))] = name
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return self._result(name, task.result())
+                    error = task.exception()
+                    print(f"Router: {name} failed: {error}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Tokens cannot be taken back once sent, so streams fall through on error instead of hedging
+        error = None
+        for name in self.ranked():
+            start_time = time.perf_counter()
+            started = False
+            try:
+                async for chunk in self.models[name].astream(messages, stop=stop, **kwargs):
+                    started = True
+                    if not isinstance(chunk, BaseMessageChunk):
+                        # Backends without native streaming yield the whole message once
+                        chunk = AIMessageChunk(content=chunk.content, response_metadata=chunk.response_metadata)
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                self._stats[name].record(error=True)
+                if started:
+                    raise
+                error = e
+                print(f"Router: {name} failed before streaming: {e}")
+                continue
+            self._stats[name].record(latency=time.perf_counter() - start_time)
+            self._stats[name].wins += 1
+            return
+        raise error
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice == "any":
+            tool_choice = "required"
+        elif isinstance(tool_choice, str) and tool_choice not in ("auto", "none", "required"):
+            tool_choice = {"type": "function", "function": {"name": tool_choice}}
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted_tools, **kwargs)
+
+    def with_structured_output(self, schema, *, method="function_calling", include_raw=False, **kwargs):
+        if method != "json_mode":
+            return super().with_structured_output(schema, include_raw=include_raw, **kwargs)
+        llm = self.bind(response_format={"type": "json_object"})
+        parser = PydanticOutputParser(pydantic_object=schema)
+        if not include_raw:
+            return llm | parser
+        parser_assign = RunnablePassthrough.assign(parsed=itemgetter("raw") | parser, parsing_error=lambda _: None)
+        parser_none = RunnablePassthrough.assign(parsed=lambda _: None)
+        return RunnableMap(raw=llm) | parser_assign.with_fallbacks([parser_none], exception_key="parsing_error")
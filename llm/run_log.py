@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+FIELDS = ["timestamp", "session_id", "model_name", "user_input", "response", "duration"]
+
+
+class RunLogWriter:
+    """Appends run log records from a background thread.
+
+    `log` only puts the record on a bounded queue, so a slow disk never holds
+    up a patient turn; when the queue is full the record is dropped and
+    counted instead. The writer flushes in batches and rotates the file once
+    it passes `max_bytes` or is older than `rotate_interval` seconds.
+    """
+
+    def __init__(self, path="runtime_log.csv", fmt="csv", max_queue=1000, batch_size=100,
+                 flush_interval=1.0, max_bytes=10_000_000, rotate_interval=None, backups=5):
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError("Invalid run log format. Supported formats are 'csv' and 'jsonl'.")
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._opened_at = time.time()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="run-log", daemon=True)
+        self._thread.start()
+
+    def log(self, **record):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _format(self, records):
+        if self.fmt == "jsonl":
+            return "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS, extrasaction="ignore", lineterminator="\n")
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            writer.writeheader()
+        writer.writerows(records)
+        return buffer.getvalue()
+
+    def _should_rotate(self):
+        if not os.path.exists(self.path):
+            return False
+        if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        # runtime_log.csv -> runtime_log.csv.1 -> ... -> runtime_log.csv.<backups>
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._opened_at = time.time()
+        self.rotations += 1
+
+    def _write(self, records):
+        try:
+            if self._should_rotate():
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8", newline="") as log_file:
+                log_file.write(self._format(records))
+            self.written += len(records)
+        except OSError as e:
+            self.dropped += len(records)
+            print(f"Run log write failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            if record is None:
+                return
+            batch = [record]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            if stop:
+                return
+
+    def close(self, timeout=5):
+        """Flush what is queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "format": self.fmt,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+        }
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class Session:
+    def __init__(self, session_id, nurse_llm):
+        self.session_id = session_id
+        self.nurse_llm = nurse_llm
+        self.lock = asyncio.Lock()
+        self.created_at = time.monotonic()
+        self.last_access = self.created_at
+
+
+class SessionManager:
+    """Keeps one VirtualNurseLLM per session id.
+
+    Sessions idle for longer than `ttl` seconds are dropped, and once
+    `max_sessions` is reached the least recently used session is evicted.
+    With a TurnJournal, a session that is not in memory (evicted, or lost
+    in a restart) is rebuilt from its journal, and expired sessions have
+    their journal discarded. Every session carries its own asyncio lock so
+    concurrent requests for the same patient are serialized while different
+    patients run in parallel.
+    """
+
+    def __init__(self, factory, ttl=1800, max_sessions=1000, journal=None):
+        self.factory = factory
+        self.journal = journal
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, session_id):
+        return self._lookup(session_id, create=True)
+
+    def peek(self, session_id):
+        """Like get, but returns None instead of starting a new session."""
+        return self._lookup(session_id, create=False)
+
+    def _lookup(self, session_id, create):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                # Unknown ids are common on peek, only build a nurse for a session that can exist
+                restorable = self.journal is not None and self.journal.exists(session_id)
+                if not (restorable or create):
+                    return None
+                nurse_llm = self.factory()
+                if restorable and self.journal.restore(session_id, nurse_llm):
+                    print(f"Resumed session {session_id} from journal")
+                elif not create:
+                    return None
+                while len(self._sessions) >= self.max_sessions:
+                    evicted_id, _ = self._sessions.popitem(last=False)
+                    self.evicted += 1
+                    print(f"Evicted session {evicted_id} (max_sessions={self.max_sessions})")
+                session = Session(session_id, nurse_llm)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            return session
+
+    def __contains__(self, session_id):
+        return self.peek(session_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+    def _expire(self, now):
+        # OrderedDict is kept in access order, so expired sessions sit at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.ttl:
+                break
+            del self._sessions[session_id]
+            if self.journal is not None:
+                self.journal.discard(session_id)
+            self.expired += 1
+            print(f"Session {session_id} expired after {self.ttl} seconds idle")
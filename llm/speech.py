@@ -0,0 +1,115 @@
+import base64
+from llm.http_pool import get_http_clients
+
+SPEECH_ENDPOINTS = {
+    "vaja9": "/generate_voice_vaja9/",
+    "botnoi": "/generate_voice_botnoi/",
+}
+
+SENTENCE_PUNCTUATION = ".?!…"
+
+
+def load_sentence_engine(engine="crfcut", fallback="whitespace+newline"):
+    """Import pythainlp and load the sentence model, returns the engine to split with.
+
+    Called at startup so the first speech turn does not pay for it. Falls
+    back to `fallback` when the engine's dependencies are not installed.
+    """
+    try:
+        from pythainlp.tokenize import sent_tokenize
+        sent_tokenize("สวัสดีค่ะ ทดสอบ", engine=engine)
+    except ImportError as e:
+        print(f"Sentence engine {engine} is unavailable ({e}), splitting speech with {fallback}")
+        return fallback
+    return engine
+
+
+class SentenceSplitter:
+    """Cuts a streamed reply into sentences as soon as each one is complete.
+
+    Tokens are buffered and the buffer is split with pythainlp's
+    sent_tokenize (crfcut by default, its most accurate engine). Every
+    sentence but the last is complete (the last may still be growing), and
+    sentences shorter than `min_chars` are held back and joined with the
+    next one so the TTS service is not called for a single word.
+
+    Thai sentences only end at whitespace or punctuation, so feed is a cheap
+    append that reports when the buffer needs splitting: once text follows
+    a new boundary, since crfcut decides on a boundary from the words after
+    it. Splitting is CPU-bound, call split and flush from a worker thread.
+    """
+
+    def __init__(self, engine="crfcut", min_chars=10):
+        self.engine = engine
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._pending = ""
+        self._boundary = False
+
+    def _sentences(self, text):
+        # pythainlp is slow to import, see load_sentence_engine
+        from pythainlp.tokenize import sent_tokenize
+        return [sentence.strip() for sentence in sent_tokenize(text, engine=self.engine) if sentence.strip()]
+
+    def _emit(self, sentences):
+        ready = []
+        for sentence in sentences:
+            self._pending = f"{self._pending} {sentence}".strip()
+            if len(self._pending) >= self.min_chars:
+                ready.append(self._pending)
+                self._pending = ""
+        return ready
+
+    def feed(self, token):
+        """Add a token, returns True when the buffer should be split."""
+        self._buffer += token
+        due = self._boundary and bool(token.strip())
+        if due:
+            self._boundary = False
+        if any(c.isspace() or c in SENTENCE_PUNCTUATION for c in token):
+            self._boundary = True
+        return due
+
+    def split(self):
+        """Returns the sentences completed by the tokens fed so far."""
+        sentences = self._sentences(self._buffer)
+        if len(sentences) < 2:
+            return []
+        start = self._buffer.rfind(sentences[-1])
+        if start < 0:
+            # The engine rewrote the text, wait for the end of the reply
+            return []
+        # Keep the unfinished last sentence, and whatever whitespace follows it, for the next token
+        self._buffer = self._buffer[start:]
+        return self._emit(sentences[:-1])
+
+    def flush(self):
+        """Return the rest of the reply once the stream has ended."""
+        sentences = self._emit(self._sentences(self._buffer))
+        self._buffer = ""
+        self._boundary = False
+        if self._pending:
+            sentences.append(self._pending)
+            self._pending = ""
+        return sentences
+
+
+class SpeechClient:
+    """Synthesizes sentences through the TTS service (tts/tts.py) over pooled connections."""
+
+    def __init__(self, base_url, provider="vaja9", timeout=60):
+        if provider not in SPEECH_ENDPOINTS:
+            raise ValueError(f"Unknown speech provider {provider!r}, expected one of {list(SPEECH_ENDPOINTS)}")
+        self.base_url = base_url.rstrip("/")
+        self.provider = provider
+        self.timeout = timeout
+
+    async def synthesize(self, text):
+        """Return (media type, base64 audio) for `text`."""
+        _, client = get_http_clients(self.base_url)
+        response = await client.post(
+            f"{self.base_url}{SPEECH_ENDPOINTS[self.provider]}", json={"text": text}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        media_type = response.headers.get("Content-Type", "application/octet-stream")
+        return media_type, base64.b64encode(response.content).decode("ascii")
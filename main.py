@@ -1,29 +1,114 @@
 from typing import Optional
-import uvicorn
 from llm.basemodel import EHRModel
 from llm.llm import VirtualNurseLLM
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from llm.models import model_list, get_model
+from llm.models import model_list, get_model, cached_model, warm_up_probes
+from llm.http_pool import warm_up, aclose_all
+from llm.run_log import RunLogWriter
+from llm.metrics import REGISTRY, STAGE_SECONDS, TURN_SECONDS
+from contextlib import aclosing, asynccontextmanager
+from llm.session import SessionManager
+from llm.journal import TurnJournal
+from llm.cache import ExtractionCache, prompt_version
+from llm.fast_extract import ThaiFastExtractor
+from llm.prompt import TASK_INSTRUCTIONS, JSON_EXAMPLE
+from llm.speech import SentenceSplitter, SpeechClient, load_sentence_engine
+import asyncio
+import json
+import os
 import time
+import uuid
 
 initial_model = "typhoon-v1.5x-70b-instruct"
-nurse_llm = VirtualNurseLLM(
-    # base_url=model_list[initial_model]["base_url"],
-    model_name=model_list[initial_model]["model_name"],
-    # api_key=model_list[initial_model]["api_key"]
+default_session_id = "default"
+
+extraction_cache = None
+if os.getenv("EXTRACTION_CACHE", "true").lower() == "true":
+    extraction_cache = ExtractionCache(
+        namespace=prompt_version(TASK_INSTRUCTIONS["extract_ehr"] + TASK_INSTRUCTIONS["extract_ehr_patch"] + JSON_EXAMPLE),
+        max_entries=int(os.getenv("EXTRACTION_CACHE_SIZE", 1024)),
+        ttl=int(os.getenv("EXTRACTION_CACHE_TTL", 86400)),
+        path=os.getenv("EXTRACTION_CACHE_PATH") or None,
+    )
+
+fast_extractor = None
+if os.getenv("FAST_EXTRACT", "true").lower() == "true":
+    fast_extractor = ThaiFastExtractor()
+
+def create_nurse_llm():
+    # Clients are shared between sessions, only the conversation state is per session
+    nurse_llm = VirtualNurseLLM(
+        history_token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", 1500)),
+        history_summary_budget=int(os.getenv("HISTORY_SUMMARY_BUDGET", 300)),
+    )
+    nurse_llm.model_name = initial_model
+    nurse_llm.client = get_model(initial_model)
+    nurse_llm.speculative = os.getenv("SPECULATIVE_QUESTIONS", "false").lower() == "true"
+    nurse_llm.extraction_cache = extraction_cache
+    nurse_llm.fast_extractor = fast_extractor
+    nurse_llm.extraction_mode = os.getenv("EXTRACTION_MODE", "text")
+    nurse_llm.question_planning = os.getenv("QUESTION_PLANNING", "single")
+    nurse_llm.background_refactor = os.getenv("BACKGROUND_REFACTOR", "true").lower() == "true"
+    return nurse_llm
+
+run_log_format = os.getenv("RUN_LOG_FORMAT", "csv")
+run_log = RunLogWriter(
+    # Empty means runtime_log.<format>, so switching RUN_LOG_FORMAT alone picks the matching file
+    path=os.getenv("RUN_LOG_PATH") or f"runtime_log.{run_log_format}",
+    fmt=run_log_format,
+    max_queue=int(os.getenv("RUN_LOG_QUEUE_SIZE", 1000)),
+    max_bytes=int(os.getenv("RUN_LOG_MAX_BYTES", 10_000_000)),
+    rotate_interval=float(os.getenv("RUN_LOG_ROTATE_INTERVAL", 0)) or None,
+    backups=int(os.getenv("RUN_LOG_BACKUPS", 5)),
+)
+
+journal = None
+if os.getenv("SESSION_JOURNAL_DIR"):
+    journal = TurnJournal(
+        os.getenv("SESSION_JOURNAL_DIR"),
+        snapshot_every=int(os.getenv("SESSION_JOURNAL_SNAPSHOT_EVERY", 20)),
+        flush_interval=float(os.getenv("SESSION_JOURNAL_FLUSH_INTERVAL", 0.05)),
+    )
+    journal.sweep(int(os.getenv("SESSION_TTL", 1800)))
+
+speech_client = SpeechClient(
+    os.getenv("TTS_SERVICE_URL", "http://127.0.0.1:8001"),
+    provider=os.getenv("SPEECH_PROVIDER", "vaja9"),
+    timeout=float(os.getenv("SPEECH_TIMEOUT", 60)),
+)
+speech_concurrency = int(os.getenv("SPEECH_CONCURRENCY", 3))
+speech_sent_engine = os.getenv("SPEECH_SENT_ENGINE", "crfcut")
+
+sessions = SessionManager(
+    create_nurse_llm,
+    ttl=int(os.getenv("SESSION_TTL", 1800)),
+    max_sessions=int(os.getenv("MAX_SESSIONS", 1000)),
+    journal=journal,
 )
 
-# model: OpenThaiGPT
-# nurse_llm = VirtualNurseLLM(
-#     base_url="https://api.aieat.or.th/v1",
-#     model=".",
-#     api_key="dummy"
-# )
+@asynccontextmanager
+async def lifespan(app):
+    if fast_extractor is not None:
+        # Import pythainlp now rather than in the first patient turn, on a worker thread
+        await run_in_threadpool(fast_extractor.load)
+    global speech_sent_engine
+    speech_sent_engine = await run_in_threadpool(load_sentence_engine, speech_sent_engine)
+    if os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true":
+        # Build the default client and open connections before the first patient turn
+        get_model(initial_model)
+        await warm_up(warm_up_probes())
+    yield
+    await aclose_all()
+    run_log.close()
+    if journal is not None:
+        journal.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +121,7 @@ app.add_middleware(
 class UserInput(BaseModel):
     user_input: str
     model_name: str = "typhoon-v1.5x-70b-instruct"
+    session_id: str = default_session_id
 
 class NurseResponse(BaseModel):
     nurse_response: str
@@ -67,62 +153,292 @@ def read_index():
     </html>
     """
 
+@app.post("/session")
+async def create_session():
+    session_id = uuid.uuid4().hex
+    sessions.get(session_id)
+    return {"session_id": session_id}
+
+@app.get("/sessions")
+async def get_session_stats():
+    return sessions.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/journal/stats")
+def get_journal_stats():
+    if journal is None:
+        return {"enabled": False}
+    return {"enabled": True, **journal.stats()}
+
+@app.get("/run_log/stats")
+def get_run_log_stats():
+    return run_log.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    if extraction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **extraction_cache.stats()}
+
+@app.get("/fast_extract/stats")
+async def get_fast_extract_stats():
+    if fast_extractor is None:
+        return {"enabled": False}
+    return {"enabled": True, **fast_extractor.stats()}
+
+@app.get("/router/stats")
+async def get_router_stats():
+    router = cached_model("router")
+    if router is None:
+        return {"enabled": False}
+    return {"enabled": True, "models": router.stats()}
+
+def existing_session(session_id):
+    # Read-only endpoints must not start a session for an unknown id
+    session = sessions.peek(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return session
+
 @app.get("/history")
-def get_chat_history():
-    return ChatHistory(chat_history = nurse_llm.chat_history)
+async def get_chat_history(session_id: str = default_session_id):
+    session = existing_session(session_id)
+    async with session.lock:
+        return ChatHistory(chat_history = list(session.nurse_llm.chat_history))
 
 @app.get("/details")
-def get_ehr_data():
-    return EHRData(
-        ehr_data=nurse_llm.ehr_data,
-        current_context=nurse_llm.current_context,
-        current_prompt=nurse_llm.current_prompt,
-        current_prompt_ehr=nurse_llm.current_prompt_ehr,
-        current_patient_response=nurse_llm.current_patient_response,
-        current_question=nurse_llm.current_question
-    )
+async def get_ehr_data(session_id: str = default_session_id):
+    session = existing_session(session_id)
+    async with session.lock:
+        nurse_llm = session.nurse_llm
+        return EHRData(
+            ehr_data=nurse_llm.collect_refactor(),
+            current_context=nurse_llm.current_context,
+            current_prompt=nurse_llm.current_prompt,
+            current_prompt_ehr=nurse_llm.current_prompt_ehr,
+            current_patient_response=nurse_llm.current_patient_response,
+            current_question=nurse_llm.current_question
+        )
 
-def toggle_debug():
+@app.get("/refactor/status")
+async def get_refactor_status(session_id: str = default_session_id):
+    """
+    Status of the final EHR refactor started when the interview ended: "none", "running", "done", "failed" or "cancelled".
+    The refactored ehr_data is included once it is done.
+    """
+    nurse_llm = existing_session(session_id).nurse_llm
+    job = nurse_llm.refactor_job
+    if job is None:
+        return {"status": "none"}
+    status = job.snapshot()
+    if status["status"] == "done":
+        status["ehr_data"] = job.result()
+    return status
+
+def toggle_debug(session_id: str = default_session_id):
+    nurse_llm = sessions.get(session_id).nurse_llm
     nurse_llm.debug = not nurse_llm.debug
     return {"debug_mode": "on" if nurse_llm.debug else "off"}
 
 
 @app.post("/reset")
-def data_reset():
-    nurse_llm.reset()
-    print("Chat history and EHR data have been reset.")
+async def data_reset(session_id: str = default_session_id):
+    session = sessions.get(session_id)
+    async with session.lock:
+        session.nurse_llm.reset()
+        if journal is not None:
+            journal.record_reset(session_id, session.nurse_llm)
+    print(f"Chat history and EHR data have been reset for session {session_id}.")
+
+def switch_model(nurse_llm, model_name):
+    if model_name == nurse_llm.model_name:
+        return True
+    print(f"Changing model to {model_name}")
+    try:
+        nurse_llm.client = get_model(model_name=model_name)
+    except (KeyError, ValueError):
+        return False
+    nurse_llm.model_name = model_name
+    return True
+
+def journal_turn(session_id, nurse_llm, patient_response, before_ehr, before_job):
+    if journal is None:
+        return
+    journal.record_turn(session_id, nurse_llm, patient_response, before_ehr)
+    job = nurse_llm.refactor_job
+    if job is not None and job is not before_job:
+        # The refactored EHR lands after the turn, journal it when the job finishes
+        job.future.add_done_callback(
+            lambda _: job.status() == "done" and journal.record_ehr(session_id, job.result())
+        )
 
-model_cache = {}
-def get_model_cached(model_name):
-    if model_name not in model_cache:
-        model_cache[model_name] = get_model(model_name=model_name)
-    return model_cache[model_name]
+def write_runtime_log(user_input, response, duration):
+    # Queued for the background writer, never blocks the turn
+    run_log.log(
+        timestamp=time.time(),
+        session_id=user_input.session_id,
+        model_name=user_input.model_name,
+        user_input=user_input.user_input,
+        response=response,
+        duration=duration,
+    )
 
 @app.post("/nurse_response")
-def nurse_response(user_input: UserInput):
+async def nurse_response(user_input: UserInput):
     """
-    Models: "typhoon-v1.5x-70b-instruct (default)", "openthaigpt", "llama-3.3-70b-versatile"
+    Models: "typhoon-v1.5x-70b-instruct (default)", "openthaigpt", "llama-3.3-70b-versatile", "router"
     """
     
     start_time = time.time()
-    if user_input.model_name != nurse_llm.model_name:
-        print(f"Changing model to {user_input.model_name}")
-        try:
-            nurse_llm.client = get_model_cached(model_name=user_input.model_name)
-        except ValueError:
+    session = sessions.get(user_input.session_id)
+    async with session.lock:
+        nurse_llm = session.nurse_llm
+        if not switch_model(nurse_llm, user_input.model_name):
             return {"error": "Invalid model name"}
-    print(nurse_llm.client)
-    
-    # response = nurse_llm.slim_invoke(user_input.user_input)
-    response = nurse_llm.invoke(user_input.user_input)
+        print(nurse_llm.client)
+
+        # response = nurse_llm.slim_invoke(user_input.user_input)
+        before_ehr, before_job = nurse_llm.ehr_snapshot(), nurse_llm.refactor_job
+        response = await nurse_llm.ainvoke(user_input.user_input)
+        journal_turn(user_input.session_id, nurse_llm, user_input.user_input, before_ehr, before_job)
     end_time = time.time()
     duration = end_time - start_time
     print(f"Function running time: {duration} seconds")
-    # Log the model name, user input, response, and execution time in CSV format
-    with open("runtime_log.csv", "a") as log_file:
-        log_file.write(f"{user_input.model_name},{user_input.user_input},{response},{duration}\n")
+    TURN_SECONDS.observe(duration, endpoint="nurse_response", model=user_input.model_name)
+    write_runtime_log(user_input, response, duration)
     
     return NurseResponse(nurse_response=response)
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@app.post("/nurse_response/stream")
+async def nurse_response_stream(user_input: UserInput):
+    """
+    Server-sent events: one "token" event per chunk of the nurse's question,
+    then a "done" event with the full response and the updated EHR.
+    """
+    session = sessions.get(user_input.session_id)
+    if user_input.model_name not in model_list:
+        return {"error": "Invalid model name"}
+
+    async def event_stream():
+        start_time = time.time()
+        async with session.lock:
+            nurse_llm = session.nurse_llm
+            if not switch_model(nurse_llm, user_input.model_name):
+                yield sse_event("error", {"error": "Invalid model name"})
+                return
+            before_ehr, before_job = nurse_llm.ehr_snapshot(), nurse_llm.refactor_job
+            try:
+                async with aclosing(nurse_llm.astream(user_input.user_input)) as tokens:
+                    async for token in tokens:
+                        yield sse_event("token", {"content": token})
+            except Exception as e:
+                print(f"Streaming failed: {e}")
+                yield sse_event("error", {"error": str(e)})
+                return
+            finally:
+                # astream records the turn even when it is cut off, journal it either way
+                journal_turn(user_input.session_id, nurse_llm, user_input.user_input, before_ehr, before_job)
+            response = nurse_llm.current_question
+            yield sse_event("done", {"nurse_response": response, "ehr_data": nurse_llm.ehr_data})
+        duration = time.time() - start_time
+        print(f"Function running time: {duration} seconds")
+        TURN_SECONDS.observe(duration, endpoint="nurse_response_stream", model=user_input.model_name)
+        write_runtime_log(user_input, response, duration)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/nurse_response/speech")
+async def nurse_response_speech(user_input: UserInput):
+    """
+    Server-sent events like /nurse_response/stream, plus one "audio" event per
+    sentence of the question (base64 audio from the TTS service, in order) sent
+    as soon as that sentence is synthesized. Sentences are sent to TTS while
+    the rest of the question is still being generated.
+    """
+    session = sessions.get(user_input.session_id)
+    if user_input.model_name not in model_list:
+        return {"error": "Invalid model name"}
+
+    async def event_stream():
+        start_time = time.time()
+        splitter = SentenceSplitter(
+            engine=speech_sent_engine,
+            min_chars=int(os.getenv("SPEECH_MIN_CHARS", 10)),
+        )
+        semaphore = asyncio.Semaphore(speech_concurrency)
+        pending = []
+        sentence_count = 0
+        first_audio = None
+
+        async def synthesize(text):
+            async with semaphore:
+                return await speech_client.synthesize(text)
+
+        def start(sentences):
+            nonlocal sentence_count
+            for text in sentences:
+                pending.append((sentence_count, text, asyncio.create_task(synthesize(text))))
+                sentence_count += 1
+
+        async def audio_events(wait):
+            # Audio goes out in sentence order, a finished later sentence waits for the ones before it
+            nonlocal first_audio
+            while pending and (wait or pending[0][2].done()):
+                index, text, task = pending.pop(0)
+                try:
+                    media_type, audio = await task
+                except Exception as e:
+                    print(f"Speech synthesis failed: {e!r}")
+                    yield sse_event("audio_error", {"index": index, "text": text, "error": str(e)})
+                    continue
+                if first_audio is None:
+                    first_audio = time.time() - start_time
+                    STAGE_SECONDS.observe(first_audio, stage="time_to_first_audio", model=user_input.model_name)
+                yield sse_event("audio", {"index": index, "text": text, "media_type": media_type, "audio": audio})
+
+        try:
+            async with session.lock:
+                nurse_llm = session.nurse_llm
+                if not switch_model(nurse_llm, user_input.model_name):
+                    yield sse_event("error", {"error": "Invalid model name"})
+                    return
+                before_ehr, before_job = nurse_llm.ehr_snapshot(), nurse_llm.refactor_job
+                try:
+                    async with aclosing(nurse_llm.astream(user_input.user_input)) as tokens:
+                        async for token in tokens:
+                            yield sse_event("token", {"content": token})
+                            if splitter.feed(token):
+                                start(await run_in_threadpool(splitter.split))
+                            async for event in audio_events(wait=False):
+                                yield event
+                except Exception as e:
+                    print(f"Streaming failed: {e}")
+                    yield sse_event("error", {"error": str(e)})
+                    return
+                finally:
+                    journal_turn(user_input.session_id, nurse_llm, user_input.user_input, before_ehr, before_job)
+                start(await run_in_threadpool(splitter.flush))
+                response = nurse_llm.current_question
+            async for event in audio_events(wait=True):
+                yield event
+            yield sse_event("done", {"nurse_response": response, "ehr_data": nurse_llm.ehr_data})
+        finally:
+            # Client gone or turn failed, stop paying for audio nobody will hear
+            for _, _, task in pending:
+                task.cancel()
+        duration = time.time() - start_time
+        print(f"Function running time: {duration} seconds (first audio after {first_audio} seconds)")
+        TURN_SECONDS.observe(duration, endpoint="nurse_response_speech", model=user_input.model_name)
+        write_runtime_log(user_input, response, duration)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,50 @@
+import importlib.util
+import unittest
+
+from llm.fast_extract import ThaiFastExtractor
+from llm.llm import VirtualNurseLLM
+
+NAME = {"prefix": "นาง", "firstname": "สมศรี", "surname": "ใจดี"}
+
+
+@unittest.skipIf(importlib.util.find_spec("pythainlp") is None, "pythainlp is not installed")
+class FastExtractTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.extractor = ThaiFastExtractor()
+        cls.extractor.load()
+
+    def nurse(self, ehr_data):
+        nurse_llm = VirtualNurseLLM()
+        nurse_llm.fast_extractor = self.extractor
+        nurse_llm.ehr_data = dict(ehr_data)
+        return nurse_llm
+
+    def test_name_sets_gender(self):
+        fields = self.extractor.extract("นางสมศรี ใจดีค่ะ")
+        self.assertEqual(fields, {"name": NAME, "gender": "หญิง"})
+
+    def test_age_when_asked_for_it(self):
+        self.assertEqual(self.extractor.extract("45 ปีค่ะ", expected_field="age"), {"age": 45})
+        self.assertEqual(self.extractor.extract("อายุ 45 ค่ะ"), {"age": 45})
+
+    def test_duration_is_not_an_age(self):
+        # "2 ปี" answering how long the symptoms have lasted
+        self.assertIsNone(self.extractor.extract("2 ปีค่ะ", expected_field="present_illness"))
+        self.assertIsNone(self.extractor.extract("2 ปีค่ะ"))
+
+    def test_duration_answer_keeps_the_stored_age(self):
+        nurse_llm = self.nurse({"name": NAME, "age": 45, "gender": "หญิง", "chief_complaint": "ปวดหัว"})
+        self.assertIsNone(nurse_llm._fast_extract("2 ปีค่ะ"))
+        self.assertEqual(nurse_llm.ehr_data["age"], 45)
+
+    def test_filled_field_is_not_overwritten(self):
+        nurse_llm = self.nurse({"name": NAME, "gender": "หญิง"})
+        self.assertIsNone(nurse_llm._fast_extract("ผู้ชายครับ"))
+        self.assertEqual(nurse_llm.ehr_data["gender"], "หญิง")
+        # Restating the same value is fine
+        self.assertEqual(nurse_llm._fast_extract("อายุ 45 ปี เป็นผู้หญิงค่ะ")["age"], 45)
+
+
+if __name__ == "__main__":
+    unittest.main()
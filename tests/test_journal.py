@@ -0,0 +1,57 @@
+import os
+import tempfile
+import time
+import unittest
+
+from llm.journal import TurnJournal
+from llm.llm import VirtualNurseLLM
+
+
+def make_nurse(question):
+    nurse_llm = VirtualNurseLLM()
+    nurse_llm.add_message("assistant", question)
+    nurse_llm.current_question = question
+    return nurse_llm
+
+
+class TurnJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = TurnJournal(self.directory, snapshot_every=2, flush_interval=0.01, fsync=False)
+        self.addCleanup(self.journal.close)
+
+    def flush(self):
+        self.journal._queue.join()
+
+    def test_similar_session_ids_do_not_share_files(self):
+        for session_id in ("a.b", "a_b", "a/b"):
+            self.journal.record_turn(session_id, make_nurse(session_id), "hi", {})
+        self.flush()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        for session_id in ("a.b", "a_b", "a/b"):
+            restored = VirtualNurseLLM()
+            self.assertTrue(self.journal.restore(session_id, restored))
+            self.assertEqual(restored.current_question, session_id)
+
+    def test_sweep_keeps_an_old_snapshot_while_its_journal_is_fresh(self):
+        nurse_llm = make_nurse("q")
+        for _ in range(3):
+            self.journal.record_turn("active", nurse_llm, "hi", {})
+        self.journal.record_turn("expired", nurse_llm, "hi", {})
+        self.flush()
+        journal_path, snapshot_path = self.journal._paths("active")
+        self.assertTrue(os.path.exists(journal_path) and os.path.exists(snapshot_path))
+        old = time.time() - 3600
+        os.utime(snapshot_path, (old, old))
+        for path in self.journal._paths("expired"):
+            if os.path.exists(path):
+                os.utime(path, (old, old))
+
+        self.assertEqual(self.journal.sweep(1800), 1)
+        self.assertTrue(os.path.exists(snapshot_path))
+        self.assertTrue(self.journal.restore("active", VirtualNurseLLM()))
+        self.assertFalse(self.journal.restore("expired", VirtualNurseLLM()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from llm.json_repair import coerce_ehr, repair_json
+
+
+class RepairJsonTest(unittest.TestCase):
+    def test_truncated_response(self):
+        self.assertEqual(repair_json('```json\n{"age": 45, "chief_complaint": ["ปวดหัว"'), {"age": 45, "chief_complaint": ["ปวดหัว"]})
+
+    def test_python_literals(self):
+        self.assertEqual(repair_json("{'gender': None, 'age': 30,}"), {"gender": None, "age": 30})
+
+
+class CoerceEhrTest(unittest.TestCase):
+    def test_age_in_words(self):
+        self.assertEqual(coerce_ehr({"age": "45 ปี"}).age, 45)
+
+    def test_invalid_list_items_are_dropped(self):
+        ehr = coerce_ehr({"family_history": [{"relation": "พ่อ", "condition": "เบาหวาน"}, {"relation": "แม่"}]})
+        self.assertEqual([item.relation for item in ehr.family_history], ["พ่อ"])
+
+    def test_list_for_a_scalar_field_is_dropped(self):
+        ehr = coerce_ehr({"age": [1], "gender": ["ชาย"], "chief_complaint": ["ไข้"]})
+        self.assertIsNone(ehr.age)
+        self.assertIsNone(ehr.gender)
+        self.assertEqual(ehr.chief_complaint, ["ไข้"])
+
+    def test_not_an_object(self):
+        self.assertIsNone(coerce_ehr(["ไข้"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
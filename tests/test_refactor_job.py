@@ -0,0 +1,54 @@
+import json
+import unittest
+
+from llm.basemodel import EHRModel
+from llm.llm import VirtualNurseLLM
+from tests.test_router import FakeChatModel
+
+REFACTORED = {"chief_complaint": ["ปวดหัว"], "present_illness": ["ปวดหัวมา 2 วัน"]}
+
+
+def make_nurse():
+    nurse_llm = VirtualNurseLLM()
+    nurse_llm.client = FakeChatModel(reply=json.dumps(REFACTORED, ensure_ascii=False), latency=0.01)
+    nurse_llm.background_refactor = True
+    nurse_llm.ehr_data = {"chief_complaint": ["ปวด"]}
+    return nurse_llm
+
+
+class BackgroundRefactorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_result_is_applied_as_a_dict_by_the_session(self):
+        nurse_llm = make_nurse()
+        await nurse_llm._afinish_interview(None)
+        await nurse_llm.refactor_job.future
+        # The job only computes the EHR, the session has not applied it yet
+        self.assertEqual(nurse_llm.ehr_data, {"chief_complaint": ["ปวด"]})
+        self.assertEqual(nurse_llm.refactor_job.result()["present_illness"], REFACTORED["present_illness"])
+
+        ehr_data = nurse_llm.collect_refactor()
+        self.assertIsInstance(ehr_data, dict)
+        self.assertEqual(ehr_data["chief_complaint"], ["ปวดหัว"])
+        # A later turn writes fields in place
+        nurse_llm._apply_ehr(EHRModel(age=45))
+        self.assertEqual(nurse_llm.ehr_data["age"], 45)
+        # Applied once, a second collect does not undo the turn
+        nurse_llm.collect_refactor()
+        self.assertEqual(nurse_llm.ehr_data["age"], 45)
+
+    def test_sync_job_does_not_touch_the_session(self):
+        nurse_llm = make_nurse()
+        nurse_llm._finish_interview(None)
+        nurse_llm.refactor_job.future.result(timeout=5)
+        self.assertEqual(nurse_llm.ehr_data, {"chief_complaint": ["ปวด"]})
+        self.assertEqual(nurse_llm.collect_refactor()["chief_complaint"], ["ปวดหัว"])
+
+    def test_foreground_refactor_stores_a_dict(self):
+        nurse_llm = make_nurse()
+        nurse_llm.background_refactor = False
+        nurse_llm._finish_interview(None)
+        self.assertIsInstance(nurse_llm.ehr_data, dict)
+        self.assertEqual(nurse_llm.ehr_data["present_illness"], REFACTORED["present_illness"])
+
+
+if __name__ == "__main__":
+    unittest.main()
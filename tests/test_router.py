@@ -0,0 +1,174 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from llm import models
+from llm.router import ModelRouter
+
+
+class FakeChatModel(BaseChatModel):
+    """Backend that answers `reply` after `latency` seconds, or raises if `fail`."""
+
+    reply: str
+    latency: float = 0.0
+    fail: bool = False
+
+    _calls: int = PrivateAttr(default=0)
+    _cancelled: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _result(self):
+        if self.fail:
+            raise RuntimeError(f"{self.reply} is down")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._calls += 1
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        return self._result()
+
+
+def make_router(**backends):
+    # Declaration order is the ranking while no latencies are recorded yet
+    return ModelRouter(models=backends, default_hedge_delay=0.1, min_hedge_delay=0.01, min_samples=3)
+
+
+class RouterHedgingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_primary_is_not_hedged(self):
+        router = make_router(a=FakeChatModel(reply="a", latency=0.01), b=FakeChatModel(reply="b"))
+        message = await router.ainvoke("hi")
+        self.assertEqual(message.content, "a")
+        self.assertEqual(message.response_metadata["router_model"], "a")
+        self.assertEqual(router.models["b"]._calls, 0)
+        self.assertEqual(router.stats()["a"]["hedges"], 0)
+
+    async def test_slow_primary_is_hedged_after_default_delay(self):
+        router = make_router(a=FakeChatModel(reply="a", latency=1.0), b=FakeChatModel(reply="b", latency=0.01))
+        start_time = time.perf_counter()
+        message = await router.ainvoke("hi")
+        self.assertLess(time.perf_counter() - start_time, 0.5)
+        self.assertEqual(message.content, "b")
+        self.assertEqual(router.stats()["a"]["hedges"], 1)
+        self.assertEqual(router.stats()["b"]["wins"], 1)
+
+    async def test_hedge_waits_for_the_percentile_deadline(self):
+        primary = FakeChatModel(reply="a", latency=0.02)
+        router = make_router(a=primary, b=FakeChatModel(reply="b", latency=0.01))
+        for _ in range(3):
+            await router.ainvoke("hi")
+        self.assertEqual(router.models["b"]._calls, 0)
+        # Once enough samples exist the deadline is the primary's own percentile, not the default
+        delay = router.hedge_delay("a")
+        self.assertGreaterEqual(delay, 0.02)
+        self.assertLess(delay, 0.1)
+
+        primary.latency = 1.0
+        start_time = time.perf_counter()
+        message = await router.ainvoke("hi")
+        self.assertEqual(message.content, "b")
+        self.assertGreaterEqual(time.perf_counter() - start_time, delay)
+        self.assertLess(time.perf_counter() - start_time, 0.5)
+
+    async def test_losing_request_is_cancelled(self):
+        router = make_router(a=FakeChatModel(reply="a", latency=1.0), b=FakeChatModel(reply="b", latency=0.01))
+        await router.ainvoke("hi")
+        await asyncio.sleep(0)
+        self.assertEqual(router.models["a"]._cancelled, 1)
+        stats = router.stats()["a"]
+        self.assertEqual(stats["cancelled"], 1)
+        # A cancelled request is neither an error nor a latency sample
+        self.assertEqual(stats["errors"], 0)
+        self.assertIsNone(stats["p50"])
+
+    def test_sync_hedge(self):
+        router = make_router(a=FakeChatModel(reply="a", latency=0.5), b=FakeChatModel(reply="b", latency=0.01))
+        start_time = time.perf_counter()
+        self.assertEqual(router.invoke("hi").content, "b")
+        self.assertLess(time.perf_counter() - start_time, 0.4)
+        self.assertEqual(router.stats()["a"]["hedges"], 1)
+
+
+class RouterFailoverTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failing_backend_falls_through(self):
+        router = make_router(a=FakeChatModel(reply="a", fail=True), b=FakeChatModel(reply="b"))
+        self.assertEqual((await router.ainvoke("hi")).content, "b")
+        self.assertEqual(router.stats()["a"]["errors"], 1)
+
+    def test_sync_failover(self):
+        router = make_router(a=FakeChatModel(reply="a", fail=True), b=FakeChatModel(reply="b"))
+        self.assertEqual(router.invoke("hi").content, "b")
+
+    async def test_all_backends_failing_raises_the_last_error(self):
+        router = make_router(a=FakeChatModel(reply="a", fail=True), b=FakeChatModel(reply="b", fail=True))
+        with self.assertRaisesRegex(RuntimeError, "b is down"):
+            await router.ainvoke("hi")
+
+    async def test_stream_falls_through_before_the_first_token(self):
+        router = make_router(a=FakeChatModel(reply="a", fail=True), b=FakeChatModel(reply="b"))
+        chunks = [chunk.content async for chunk in router.astream("hi")]
+        self.assertEqual("".join(chunks), "b")
+
+    async def test_failing_backend_is_ranked_last(self):
+        router = make_router(a=FakeChatModel(reply="a", fail=True), b=FakeChatModel(reply="b"))
+        for _ in range(3):
+            await router.ainvoke("hi")
+        self.assertEqual(router.ranked(), ["b", "a"])
+        # Only the first request tried "a"
+        self.assertEqual(router.models["a"]._calls, 1)
+
+
+class RouterStatsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stats(self):
+        router = make_router(a=FakeChatModel(reply="a", latency=0.01), b=FakeChatModel(reply="b"))
+        # Keep a slow scheduler from tripping a hedge on the 10ms primary
+        router.min_hedge_delay = 0.5
+        for _ in range(4):
+            await router.ainvoke("hi")
+        stats = router.stats()
+        self.assertEqual(set(stats), {"a", "b"})
+        self.assertEqual(stats["a"]["requests"], 4)
+        self.assertEqual(stats["a"]["wins"], 4)
+        self.assertEqual(stats["a"]["error_rate"], 0.0)
+        self.assertGreaterEqual(stats["a"]["p50"], 0.01)
+        self.assertLessEqual(stats["a"]["p50"], stats["a"]["p99"])
+        self.assertEqual(stats["b"]["requests"], 0)
+        self.assertIsNone(stats["b"]["p95"])
+
+
+class RouterBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(models._model_cache.clear)
+
+    def test_backends_without_api_key_are_skipped(self):
+        with mock.patch.dict(models.model_list["typhoon-v1.5x-70b-instruct"], {"api_key": None}), \
+                mock.patch.dict(models.model_list["llama-3.3-70b-versatile"], {"api_key": None}):
+            router = models.get_model("router")
+        self.assertEqual(list(router.models), ["openthaigpt"])
+
+    def test_router_without_backends_is_invalid(self):
+        with mock.patch.dict(models.model_list["router"], {"models": ["typhoon-v1.5x-70b-instruct"]}), \
+                mock.patch.dict(models.model_list["typhoon-v1.5x-70b-instruct"], {"api_key": None}):
+            with self.assertRaises(ValueError):
+                models.get_model("router")
+
+
+if __name__ == "__main__":
+    unittest.main()
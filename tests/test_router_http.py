@@ -0,0 +1,100 @@
+import asyncio
+import importlib.util
+import socket
+import subprocess
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import httpx
+
+from llm.router import ModelRouter
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(latency):
+    """Run benchmarks.stub_server in its own process, returns (process, base URL)."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server", "--port", str(port), "--latency", str(latency), "--jitter", "0"],
+        cwd=ROOT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{base_url}/v1/models", timeout=1).raise_for_status()
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"stub server on port {port} did not start")
+
+
+def stub_stats(base_url):
+    return httpx.get(f"{base_url}/stats", timeout=1).json()
+
+
+@unittest.skipIf(importlib.util.find_spec("langchain_openai") is None, "langchain_openai is not installed")
+class RouterOverHttpTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.processes = []
+        for name, latency in (("slow", 3.0), ("fast", 0.05)):
+            process, base_url = start_stub(latency)
+            cls.processes.append(process)
+            setattr(cls, f"{name}_url", base_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.processes:
+            process.terminate()
+            process.wait(10)
+
+    def make_router(self):
+        from langchain_openai import ChatOpenAI
+
+        def backend(base_url):
+            return ChatOpenAI(base_url=f"{base_url}/v1", model="stub", api_key="stub", max_retries=0, timeout=15)
+
+        # The slow stub is the primary until latencies are recorded
+        return ModelRouter(
+            models={"slow": backend(self.slow_url), "fast": backend(self.fast_url)},
+            default_hedge_delay=0.2,
+            min_hedge_delay=0.01,
+        )
+
+    async def test_hedge_wins_and_the_loser_is_cancelled(self):
+        router = self.make_router()
+        before = stub_stats(self.slow_url)
+        start_time = time.perf_counter()
+        message = await router.ainvoke("สวัสดีค่ะ")
+        elapsed = time.perf_counter() - start_time
+
+        self.assertEqual(message.response_metadata["router_model"], "fast")
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 2.0)
+        stats = router.stats()
+        self.assertEqual(stats["slow"]["hedges"], 1)
+        self.assertEqual(stats["slow"]["cancelled"], 1)
+        self.assertEqual(stats["fast"]["wins"], 1)
+
+        # The slow stub sees the connection close well before its 3 second latency is up
+        deadline = time.monotonic() + 2
+        while stub_stats(self.slow_url)["disconnected"] == before["disconnected"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        after = stub_stats(self.slow_url)
+        self.assertEqual(after["requests"], before["requests"] + 1)
+        self.assertEqual(after["disconnected"], before["disconnected"] + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
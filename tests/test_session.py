@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+
+from llm.journal import TurnJournal
+from llm.llm import VirtualNurseLLM
+from llm.session import SessionManager
+
+
+class CountingFactory:
+    def __init__(self):
+        self.built = 0
+
+    def __call__(self):
+        self.built += 1
+        return VirtualNurseLLM()
+
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = CountingFactory()
+        self.journal = TurnJournal(tempfile.mkdtemp(), flush_interval=0.01, fsync=False)
+        self.addCleanup(self.journal.close)
+        self.sessions = SessionManager(self.factory, journal=self.journal)
+
+    def test_peek_of_an_unknown_session_builds_nothing(self):
+        self.assertIsNone(self.sessions.peek("nobody"))
+        self.assertNotIn("nobody", self.sessions)
+        self.assertEqual(self.factory.built, 0)
+
+    def test_peek_restores_a_journaled_session(self):
+        nurse_llm = VirtualNurseLLM()
+        nurse_llm.current_question = "อายุเท่าไหร่คะ"
+        self.journal.record_turn("p1", nurse_llm, "สวัสดีค่ะ", {})
+        # Still queued, exists() sees pending records too
+        session = self.sessions.peek("p1")
+        self.assertIsNotNone(session)
+        self.assertEqual(session.nurse_llm.current_question, "อายุเท่าไหร่คะ")
+        self.assertEqual(self.factory.built, 1)
+
+    def test_discarded_session_is_gone(self):
+        self.journal.record_turn("p1", VirtualNurseLLM(), "สวัสดีค่ะ", {})
+        self.journal.discard("p1")
+        self.assertIsNone(self.sessions.peek("p1"))
+        self.journal._queue.join()
+        self.assertIsNone(self.sessions.peek("p1"))
+        self.assertEqual(self.factory.built, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import importlib.util
+import unittest
+
+from llm.speech import SentenceSplitter
+
+REPLY = "สวัสดีค่ะ ดิฉันเป็นพยาบาลเสมือน วันนี้มีอาการอะไรมาคะ ปวดหัวมานานแค่ไหนแล้วคะ"
+
+
+def stream(splitter, tokens):
+    sentences, splits = [], 0
+    for token in tokens:
+        if splitter.feed(token):
+            splits += 1
+            sentences.extend(splitter.split())
+    return sentences, splitter.flush(), splits
+
+
+@unittest.skipIf(importlib.util.find_spec("pythainlp") is None, "pythainlp is not installed")
+class SentenceSplitterTest(unittest.TestCase):
+    def test_splits_only_on_boundaries(self):
+        # Three characters per token, the way the model streams Thai
+        tokens = [REPLY[i:i + 3] for i in range(0, len(REPLY), 3)]
+        sentences, rest, splits = stream(SentenceSplitter(engine="whitespace+newline"), tokens)
+        self.assertEqual(sentences, ["สวัสดีค่ะ ดิฉันเป็นพยาบาลเสมือน", "วันนี้มีอาการอะไรมาคะ"])
+        self.assertEqual(rest, ["ปวดหัวมานานแค่ไหนแล้วคะ"])
+        # Once per boundary instead of once per token
+        self.assertEqual(splits, REPLY.count(" "))
+
+    def test_splits_once_text_follows_a_boundary(self):
+        splitter = SentenceSplitter(engine="whitespace+newline")
+        self.assertFalse(splitter.feed("สวัสดี"))
+        self.assertFalse(splitter.feed("ค่ะ "))
+        self.assertFalse(splitter.feed(" "))
+        self.assertTrue(splitter.feed("ดิฉัน"))
+        self.assertEqual(splitter.split(), [])
+        self.assertEqual(splitter.flush(), ["สวัสดีค่ะ ดิฉัน"])
+
+    def test_crfcut_matches_splitting_the_whole_reply(self):
+        if importlib.util.find_spec("pycrfsuite") is None:
+            self.skipTest("python-crfsuite is not installed")
+        tokens = [REPLY[i:i + 3] for i in range(0, len(REPLY), 3)]
+        sentences, rest, _ = stream(SentenceSplitter(), tokens)
+        # Sentences come out while the reply is still streaming, and nothing is lost or repeated
+        self.assertTrue(sentences)
+        self.assertEqual(" ".join(sentences + rest), REPLY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+
+class AudioCache:
+    """Content-addressed on-disk cache of synthesized audio.
+
+    Keys hash the provider, the normalized text and every voice setting, so
+    a phrase is synthesized once per voice. Files live in `directory` and
+    the least recently used ones are deleted once they take more than
+    `max_bytes`. Access order is kept in file mtimes, so the LRU order
+    survives restarts.
+    """
+
+    def __init__(self, directory, max_bytes=500_000_000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def make_key(self, provider, text, **settings):
+        text = " ".join(unicodedata.normalize("NFC", text).split())
+        payload = json.dumps({"provider": provider, "text": text, **settings}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, extension):
+        """Return the cached file's path, or None."""
+        name = f"{key}.{extension}"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if name in self._entries:
+                try:
+                    os.utime(path)
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return path
+                except FileNotFoundError:
+                    # Deleted behind our back
+                    self.total_bytes -= self._entries.pop(name)
+            self.misses += 1
+            return None
+
+    def writer(self, key, extension):
+        return AudioCacheWriter(self, key, extension)
+
+    def put(self, key, extension, chunks):
+        """Store the bytes-like `chunks` atomically and return the file's path."""
+        writer = self.writer(key, extension)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def put_file(self, key, extension, source_path):
+        """Move an already written file into the cache and return its new path."""
+        name = f"{key}.{extension}"
+        path = os.path.join(self.directory, name)
+        # A plain rename unless source_path is on another filesystem
+        shutil.move(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self.stores += 1
+            self._evict()
+        return path
+
+    def _evict(self):
+        # Never evicts the entry just stored, even if it alone is over budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+class AudioCacheWriter:
+    """Copies a response into the cache while it is streamed to the client.
+
+    Data goes to a temporary file in the cache directory and only becomes
+    a cache entry on commit(). abort() deletes it, e.g. when the client
+    disconnects or the provider fails halfway.
+    """
+
+    def __init__(self, cache, key, extension):
+        self.cache = cache
+        self.key = key
+        self.extension = extension
+        self.tmp_path = os.path.join(cache.directory, f"{key}.{extension}.{uuid.uuid4().hex}.tmp")
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+
+    def commit(self, header=None):
+        """Add the file to the cache, first overwriting its start with `header` if given."""
+        if header is not None:
+            self._file.seek(0)
+            self._file.write(header)
+        self._file.close()
+        return self.cache.put_file(self.key, self.extension, self.tmp_path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
@@ -1,16 +1,93 @@
+import asyncio
+import math
+import struct
+import time
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI, HTTPException
-from pythainlp.tokenize import sent_tokenize
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel , Field
-import requests
-from fastapi.responses import FileResponse
-import uuid
+import httpx
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 import os
+from llm.prompt import GREETING_TEXT, ENDING_TEXT
+from tts.audio_cache import AudioCache
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+# Pooled keep-alive connections per provider. max_connections is also the
+# concurrency limit: a request waits up to TTS_POOL_TIMEOUT for a free
+# connection and then fails with 503, so slow VAJA9 syntheses cannot hold
+# up Botnoi requests (or queue forever).
+PROVIDERS = {
+    "botnoi": {
+        "max_connections": int(os.getenv("BOTNOI_MAX_CONNECTIONS", 20)),
+        "timeout": float(os.getenv("BOTNOI_TIMEOUT", 30)),
+    },
+    "vaja9": {
+        "max_connections": int(os.getenv("VAJA9_MAX_CONNECTIONS", 8)),
+        "timeout": float(os.getenv("VAJA9_TIMEOUT", 60)),
+    },
+}
+POOL_TIMEOUT = float(os.getenv("TTS_POOL_TIMEOUT", 10))
+BOTNOI_BASE_URL = os.getenv("BOTNOI_BASE_URL", "https://api-genvoice.botnoi.ai")
+VAJA9_BASE_URL = os.getenv("VAJA9_BASE_URL", "https://api.aiforthai.in.th")
+VAJA9_CHUNK_CHARS = int(os.getenv("VAJA9_CHUNK_CHARS", 150))
+VAJA9_CHUNK_CONCURRENCY = int(os.getenv("VAJA9_CHUNK_CONCURRENCY", 4))
+# Send each chunk as soon as it is ready instead of waiting for the whole reply
+VAJA9_STREAM_CHUNKS = os.getenv("VAJA9_STREAM_CHUNKS", "true").lower() == "true"
+# Thai marks sentence and phrase breaks with spaces, which is also the fastest engine
+VAJA9_SENT_ENGINE = os.getenv("VAJA9_SENT_ENGINE", "whitespace+newline")
+
+_clients = {}
+
+# Fixed phrases such as the greeting are synthesized once and served from disk
+audio_cache = None
+if os.getenv("TTS_CACHE_DIR", "tts_cache"):
+    audio_cache = AudioCache(
+        os.getenv("TTS_CACHE_DIR", "tts_cache"),
+        max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", 500_000_000)),
+    )
+
+def get_client(provider):
+    if provider not in _clients:
+        settings = PROVIDERS[provider]
+        _clients[provider] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_connections"],
+                keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60)),
+            ),
+            timeout=httpx.Timeout(settings["timeout"], pool=POOL_TIMEOUT),
+        )
+    return _clients[provider]
+
+@contextmanager
+def provider_errors(provider):
+    try:
+        yield
+    except httpx.PoolTimeout:
+        raise HTTPException(status_code=503, detail=f"Service Unavailable - Too many concurrent {provider} requests")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Gateway Timeout - The server took too long to respond")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Bad Gateway - Connection error: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prewarm = None
+    if audio_cache is not None and os.getenv("TTS_PREWARM", "true").lower() == "true":
+        # In the background so the service can answer while the phrases synthesize
+        prewarm = asyncio.create_task(prewarm_audio_cache())
+    yield
+    if prewarm is not None:
+        prewarm.cancel()
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+app = FastAPI(lifespan=lifespan)
 
 # Pydantic model for input validation
 class VoiceRequest(BaseModel):
@@ -25,13 +102,15 @@ class VoiceRequest(BaseModel):
 
 # Function to split text for text delay
 def auto_generate_text_delay_with_pythainlp(text):
+    # pythainlp is slow to import and only needed for Botnoi's text_delay
+    from pythainlp.tokenize import sent_tokenize
     text_delay = sent_tokenize(text, engine="thaisum")
     text_delay = " ".join(text_delay).strip()
     return text_delay
 
 # Function to call Botnoi's API to generate voice
-def generate_voice(audio_id, text, text_delay, speaker, volume, speed, type_media, language, token):
-    url = "https://api-genvoice.botnoi.ai/voice/v1/generate_voice?provider=botnoivoice"
+async def generate_voice(audio_id, text, text_delay, speaker, volume, speed, type_media, language, token):
+    url = f"{BOTNOI_BASE_URL}/voice/v1/generate_voice?provider=botnoivoice"
     headers = {
         "Accept": "application/json, text/plain, */*",
         "Authorization": f"Bearer {token}",
@@ -48,7 +127,8 @@ def generate_voice(audio_id, text, text_delay, speaker, volume, speed, type_medi
         "language": language,
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    with provider_errors("botnoi"):
+        response = await get_client("botnoi").post(url, headers=headers, json=payload)
     if response.status_code == 200:
         data = response.json()
         if "data" in data:
@@ -58,28 +138,87 @@ def generate_voice(audio_id, text, text_delay, speaker, volume, speed, type_medi
     else:
         raise HTTPException(status_code=response.status_code, detail="Voice generation failed")
 
-# Function to download MP3 from a URL
-def download_mp3(url, output_path):
+# Function to stream the MP3 download to the client
+async def open_mp3_stream(url):
+    """Start the Botnoi download at `url`, raising before any response goes out if it failed."""
     headers = {
         "Accept-Encoding": "identity;q=1, *;q=0",
         "Range": "bytes=0-",
         "Referer": "https://voice.botnoi.ai/",
     }
-
-    response = requests.get(url, headers=headers, stream=True)
-    if response.status_code == 200:
-        with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:  # Filter out keep-alive chunks
-                    file.write(chunk)
-    else:
+    client = get_client("botnoi")
+    with provider_errors("botnoi"):
+        response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+    if response.status_code not in (200, 206):
+        await response.aclose()
         raise HTTPException(status_code=response.status_code, detail="Failed to download MP3")
+    return response
 
-# FastAPI endpoint to generate and download voice
-@app.post("/generate_voice_botnoi/")
-def generate_voice_endpoint(request: VoiceRequest):
-    text_delay = auto_generate_text_delay_with_pythainlp(request.text)
-    audio_url = generate_voice(
+async def stream_mp3(response, cache_key=None, extension="mp3"):
+    """Yield the body of the Botnoi download `response`, copying it into the cache under `cache_key` if given.
+
+    The cache file is only opened once the body is iterated. A failure
+    halfway is raised, which aborts the connection instead of ending the
+    audio early as if it were complete.
+    """
+    cache_writer = None
+    try:
+        if cache_key is not None:
+            cache_writer = audio_cache.writer(cache_key, extension)
+        with provider_errors("botnoi"):
+            async for chunk in response.aiter_bytes():
+                if cache_writer is not None:
+                    cache_writer.write(chunk)
+                yield chunk
+        if cache_writer is not None:
+            cache_writer.commit()
+            cache_writer = None
+    finally:
+        await response.aclose()
+        if cache_writer is not None:
+            cache_writer.abort()
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs `cleanup` once it is done, even if its body was never iterated.
+
+    Releases what was opened for the body beforehand (the provider download,
+    synthesis tasks) when the client disconnects before the first byte.
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def close(self):
+        await self.body_iterator.aclose()
+        await self.cleanup()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.close()
+
+def audio_headers(filename, size=None):
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return headers
+
+async def synthesize_botnoi(request: VoiceRequest):
+    cache_key = None
+    if audio_cache is not None:
+        cache_key = audio_cache.make_key(
+            "botnoi", request.text, audio_id=request.audio_id, speaker=request.speaker, volume=request.volume,
+            speed=request.speed, type_media=request.type_media, language=request.language,
+        )
+        cached = audio_cache.get(cache_key, request.type_media)
+        if cached is not None:
+            return FileResponse(cached, media_type="audio/mpeg", filename="output.mp3")
+
+    # Tokenizing is CPU-bound, keep it off the event loop
+    text_delay = await run_in_threadpool(auto_generate_text_delay_with_pythainlp, request.text)
+    audio_url = await generate_voice(
         audio_id=request.audio_id,
         text=request.text,
         text_delay=text_delay,
@@ -90,12 +229,18 @@ def generate_voice_endpoint(request: VoiceRequest):
         language=request.language,
         token=request.token,
     )
-    
-    # Generate unique filename for the MP3
-    output_file = f"{uuid.uuid4()}.mp3"
-    download_mp3(audio_url, output_file)
-    
-    return FileResponse(output_file, media_type="audio/mpeg", filename="output.mp3")
+
+    # Playback can start with the first bytes from Botnoi, nothing is written to disk unless it is cached
+    response = await open_mp3_stream(audio_url)
+    return UpstreamStreamingResponse(
+        stream_mp3(response, cache_key, request.type_media), cleanup=response.aclose,
+        media_type="audio/mpeg", headers=audio_headers("output.mp3"),
+    )
+
+# FastAPI endpoint to generate and download voice
+@app.post("/generate_voice_botnoi/")
+async def generate_voice_endpoint(request: VoiceRequest):
+    return await synthesize_botnoi(request)
 
 # -----------------------------------------------------------VAJA9-----------------------------------------------------------
 # VAJA9 Voice Generation
@@ -105,14 +250,127 @@ class Vaja9Request(BaseModel):
     phrase_break: int = 0
     audiovisual: int = 0
 
-def split_text_into_chunks(text: str, chunk_size: int = 20) -> list:
-    words = text.split()
-    return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+def split_text_into_chunks(text: str, max_chars: int = VAJA9_CHUNK_CHARS) -> list:
+    from pythainlp.tokenize import sent_tokenize, word_tokenize
+    pieces = []
+    for sentence in sent_tokenize(text, engine=VAJA9_SENT_ENGINE):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence + " ")
+        else:
+            # Thai has no spaces between words, so fall back to word boundaries
+            pieces.extend(word_tokenize(sentence))
+            pieces[-1] += " "
+    total = len("".join(pieces).strip())
+    if not total:
+        return []
+    # Aim for equally sized chunks rather than full ones followed by a short tail
+    target = total / math.ceil(total / max_chars)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current.strip() and (len(current) >= target or len(current + piece.rstrip()) > max_chars):
+            chunks.append(current.strip())
+            current = ""
+        current += piece
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+def read_wav(data: bytes):
+    """Return (fmt chunk, PCM frames) of a RIFF/WAVE file."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise HTTPException(status_code=502, detail="Bad Gateway - VAJA9 returned an invalid WAV file")
+    fmt, frames = None, None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        offset += 8
+        if chunk_id == b"fmt ":
+            fmt = bytes(data[offset:offset + size])
+        elif chunk_id == b"data":
+            # Streamed WAVs may leave the size unset, take everything that is there
+            frames = memoryview(data)[offset:min(offset + size, len(data))]
+            break
+        offset += size + (size & 1)
+    if fmt is None or frames is None:
+        raise HTTPException(status_code=502, detail="Bad Gateway - VAJA9 returned an invalid WAV file")
+    return fmt, frames
+
+def wav_header(fmt: bytes, data_size=None):
+    """RIFF header for `data_size` bytes of PCM, or for a stream of unknown length if None."""
+    riff_size = 0xFFFFFFFF
+    if data_size is None:
+        data_size = 0xFFFFFFFF
+    else:
+        riff_size = 4 + 8 + len(fmt) + (len(fmt) & 1) + 8 + data_size
+    return b"".join([
+        struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE"),
+        struct.pack("<4sI", b"fmt ", len(fmt)), fmt, b"\0" * (len(fmt) & 1),
+        struct.pack("<4sI", b"data", data_size),
+    ])
+
+def concat_wav(wavs: list):
+    """Join WAV files with the same format into one, returns (size, chunk iterator).
+
+    The header is written once for the combined length and the PCM frames
+    of each file are yielded as views into the downloaded bytes.
+    """
+    parts = [read_wav(data) for data in wavs]
+    fmt = parts[0][0]
+    if any(part_fmt != fmt for part_fmt, _ in parts):
+        raise HTTPException(status_code=502, detail="Bad Gateway - VAJA9 chunks have different audio formats")
+    data_size = sum(len(frames) for _, frames in parts)
+    header = wav_header(fmt, data_size)
+
+    def chunks():
+        yield header
+        for _, frames in parts:
+            yield frames
+
+    return len(header) + data_size, chunks()
+
+async def stream_wav(first_wav: bytes, tasks: list, cache_key=None):
+    """Yield one WAV made of `first_wav` and the results of `tasks`, each as soon as it is ready.
 
-def generate_vaja9_voice(text: str, speaker: int, phrase_break: int, audiovisual: int):
-    url = 'https://api.aiforthai.in.th/vaja9/synth_audiovisual'
+    The total length is unknown when the header goes out, so it carries the
+    0xFFFFFFFF sizes players accept for streamed WAV. The cached copy under
+    `cache_key` gets the real header once everything has arrived. A chunk
+    that fails halfway is raised, which aborts the connection.
+    """
+    cache_writer = None
+    try:
+        if cache_key is not None:
+            cache_writer = audio_cache.writer(cache_key, "wav")
+        fmt, frames = read_wav(first_wav)
+        data_size = len(frames)
+        header = wav_header(fmt)
+        for chunk in (header, frames):
+            if cache_writer is not None:
+                cache_writer.write(chunk)
+            yield chunk
+        for task in tasks:
+            chunk_fmt, frames = read_wav(await task)
+            if chunk_fmt != fmt:
+                raise HTTPException(status_code=502, detail="Bad Gateway - VAJA9 chunks have different audio formats")
+            data_size += len(frames)
+            if cache_writer is not None:
+                cache_writer.write(frames)
+            yield frames
+        if cache_writer is not None:
+            cache_writer.commit(header=wav_header(fmt, data_size))
+            cache_writer = None
+    finally:
+        for task in tasks:
+            task.cancel()
+        if cache_writer is not None:
+            cache_writer.abort()
+
+async def generate_vaja9_voice(text: str, speaker: int, phrase_break: int, audiovisual: int):
+    url = f"{VAJA9_BASE_URL}/vaja9/synth_audiovisual"
     headers = {
-        'Apikey': os.getenv("VAJA9_API_KEY"),
+        'Apikey': os.getenv("VAJA9_API_KEY", ""),
         'Content-Type': 'application/json'
     }
     data = {
@@ -122,65 +380,118 @@ def generate_vaja9_voice(text: str, speaker: int, phrase_break: int, audiovisual
         'audiovisual': audiovisual
     }
     
-    try:
-        response = requests.post(url, json=data, headers=headers, timeout=60)  # Increased timeout to 60 seconds
-        if response.status_code == 200:
-            return response.json()['wav_url']
-        elif response.status_code == 502:
-            raise HTTPException(status_code=502, detail="Bad Gateway - The server received an invalid response from the upstream server")
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Voice generation failed")
-    except requests.exceptions.ReadTimeout:
-        raise HTTPException(status_code=504, detail="Gateway Timeout - The server took too long to respond")
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Bad Gateway - Connection error: {str(e)}")
+    with provider_errors("vaja9"):
+        response = await get_client("vaja9").post(url, json=data, headers=headers)
+    if response.status_code == 200:
+        return response.json()['wav_url']
+    elif response.status_code == 502:
+        raise HTTPException(status_code=502, detail="Bad Gateway - The server received an invalid response from the upstream server")
+    else:
+        raise HTTPException(status_code=response.status_code, detail="Voice generation failed")
 
-def download_vaja9_wav(url: str, output_path: str):
-    headers = {'Apikey': os.getenv("VAJA9_API_KEY")}
-    try:
-        response = requests.get(url, headers=headers, timeout=60)  # Increased timeout to 60 seconds
-        if response.status_code == 200:
-            with open(output_path, 'wb') as file:
-                file.write(response.content)
-        elif response.status_code == 502:
-            raise HTTPException(status_code=502, detail="Bad Gateway - The server received an invalid response from the upstream server")
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Failed to download WAV")
-    except requests.exceptions.ReadTimeout:
-        raise HTTPException(status_code=504, detail="Gateway Timeout - The server took too long to respond")
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Bad Gateway - Connection error: {str(e)}")
+# Chunks are small, they are kept in memory rather than written to files
+async def download_vaja9_wav(url: str):
+    headers = {'Apikey': os.getenv("VAJA9_API_KEY", "")}
+    with provider_errors("vaja9"):
+        response = await get_client("vaja9").get(url, headers=headers)
+    if response.status_code == 200:
+        return response.content
+    elif response.status_code == 502:
+        raise HTTPException(status_code=502, detail="Bad Gateway - The server received an invalid response from the upstream server")
+    else:
+        raise HTTPException(status_code=response.status_code, detail="Failed to download WAV")
 
-@app.post("/generate_voice_vaja9/")
-def generate_voice_vaja9_endpoint(request: Vaja9Request):
-    try:
-        # Split text into chunks of 20 words if needed
-        text_chunks = split_text_into_chunks(request.text)
-        output_files = []
-        
-        # Process each chunk
-        for chunk in text_chunks:
-            audio_url = generate_vaja9_voice(
+async def synthesize_vaja9(request: Vaja9Request):
+    cache_key = None
+    if audio_cache is not None:
+        cache_key = audio_cache.make_key(
+            "vaja9", request.text, speaker=request.speaker, phrase_break=request.phrase_break,
+            audiovisual=request.audiovisual,
+        )
+        cached = audio_cache.get(cache_key, "wav")
+        if cached is not None:
+            return FileResponse(cached, media_type="audio/wav", filename="output.wav")
+
+    text_chunks = await run_in_threadpool(split_text_into_chunks, request.text)
+    if not text_chunks:
+        raise HTTPException(status_code=400, detail="No text to synthesize")
+    # Bounded per request so one long reply cannot take every pooled VAJA9 connection
+    semaphore = asyncio.Semaphore(VAJA9_CHUNK_CONCURRENCY)
+
+    async def synthesize(chunk):
+        async with semaphore:
+            audio_url = await generate_vaja9_voice(
                 text=chunk,
                 speaker=request.speaker,
                 phrase_break=request.phrase_break,
                 audiovisual=request.audiovisual
             )
-            
-            # Generate unique filename for each chunk
-            output_file = f"{uuid.uuid4()}.wav"
-            download_vaja9_wav(audio_url, output_file)
-            output_files.append(output_file)
-        
-        # If only one chunk, return it directly
-        if len(output_files) == 1:
-            return FileResponse(output_files[0], media_type="audio/wav", filename="output.wav")
-            
-        # TODO: If multiple chunks, they should be combined into a single audio file
-        # For now, return the first chunk
-        return FileResponse(output_files[0], media_type="audio/wav", filename="output.wav")
-        
+            return await download_vaja9_wav(audio_url)
+
+    tasks = [asyncio.ensure_future(synthesize(chunk)) for chunk in text_chunks]
+    try:
+        if VAJA9_STREAM_CHUNKS and len(tasks) > 1:
+            # Start playback with the first chunk while the rest are still synthesizing
+            first_wav = await tasks[0]
+
+            async def cancel_tasks():
+                for task in tasks:
+                    task.cancel()
+
+            return UpstreamStreamingResponse(
+                stream_wav(first_wav, tasks[1:], cache_key), cleanup=cancel_tasks,
+                media_type="audio/wav", headers=audio_headers("output.wav"),
+            )
+        wavs = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    size, chunks = concat_wav(wavs)
+    if cache_key is not None:
+        path = audio_cache.put(cache_key, "wav", chunks)
+        return FileResponse(path, media_type="audio/wav", filename="output.wav")
+    return StreamingResponse(chunks, media_type="audio/wav", headers=audio_headers("output.wav", size))
+
+@app.post("/generate_voice_vaja9/")
+async def generate_voice_vaja9_endpoint(request: Vaja9Request):
+    try:
+        return await synthesize_vaja9(request)
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Bad Gateway - Unexpected error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=502, detail=f"Bad Gateway - Unexpected error: {str(e)}")
+
+# -----------------------------------------------------------Cache-----------------------------------------------------------
+async def prewarm_phrase(synthesis):
+    response = await synthesis
+    # Streamed audio only reaches the cache once its body has been read to the end
+    if isinstance(response, StreamingResponse):
+        try:
+            async for _ in response.body_iterator:
+                pass
+        finally:
+            if isinstance(response, UpstreamStreamingResponse):
+                await response.close()
+
+async def prewarm_audio_cache():
+    phrases = [GREETING_TEXT, ENDING_TEXT]
+    phrases += [phrase.strip() for phrase in os.getenv("TTS_PREWARM_PHRASES", "").split("|") if phrase.strip()]
+    jobs = []
+    # Only providers with credentials, with their default voice settings
+    if os.getenv("BOTNOI_API_TOKEN"):
+        jobs += [prewarm_phrase(synthesize_botnoi(VoiceRequest(text=phrase))) for phrase in phrases]
+    if os.getenv("VAJA9_API_KEY"):
+        jobs += [prewarm_phrase(synthesize_vaja9(Vaja9Request(text=phrase))) for phrase in phrases]
+    start_time = time.time()
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        print(f"TTS cache pre-warm failed: {error!r}")
+    print(f"Pre-warmed TTS cache with {len(jobs) - len(errors)}/{len(jobs)} phrases in {time.time() - start_time:.2f} seconds")
+
+@app.get("/tts_cache/stats")
+def tts_cache_stats():
+    if audio_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **audio_cache.stats()}